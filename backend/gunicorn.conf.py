@@ -0,0 +1,29 @@
+# Multi-worker deployment: run from the backend directory with
+#   gunicorn -c gunicorn.conf.py
+# Every worker runs the FastAPI startup hook; indexes and sample data are still created only once
+# (see bootstrap_database in server.py), and workers keep their in-memory caches in step through
+# the cluster_events collection.
+import multiprocessing
+import os
+
+wsgi_app = "server:app"
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+# Workers must import the app themselves: the Mongo client and asyncio state don't survive a fork
+preload_app = False
+# Worker heartbeat timeout: an async worker is restarted if its event loop stops checking in for this long.
+# It is not a per-request limit, so long order exports and SSE streams don't need a larger value.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+# Recycle workers now and then so slow leaks can't accumulate
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "1000"))
+
+accesslog = "-"
+errorlog = "-"
+
+# Read by server.py in each worker
+os.environ.setdefault("CLUSTER_BROADCAST", "true")
@@ -1,40 +1,778 @@
-from fastapi import FastAPI, HTTPException, Depends, status, File, UploadFile
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, status, File, UploadFile
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pymongo import (ASCENDING, DESCENDING, CursorType, DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateMany,
+                     UpdateOne, WriteConcern, monitoring)
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Literal, Optional
 import os
 import httpx
+import argparse
 import asyncio
-from datetime import datetime
+import csv
+import hashlib
+import heapq
+import hmac
+import importlib.util
+import io
+import json
+import random
+import re
+import secrets
+import threading
+import time
+import unicodedata
+import zlib
+from bisect import bisect_left, insort
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta, timezone
 import uuid
 import base64
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import jwt
 from dotenv import load_dotenv
 
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # image uploads are disabled without Pillow
+    Image = None
+
+try:
+    import brotli
+except ImportError:  # responses fall back to gzip without brotli
+    brotli = None
+
 load_dotenv()
 
 app = FastAPI()
 
-# CORS setup
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Metrics (Prometheus text exposition format)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def format_labels(label_names: tuple, label_values: tuple) -> str:
+    if not label_names:
+        return ""
+    pairs = []
+    for name, value in zip(label_names, label_values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+class Counter:
+    kind = "counter"
+    
+    def __init__(self, name: str, help_text: str, label_names: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values: Dict[tuple, float] = {}
+        # Mongo command events arrive on driver threads, not the event loop
+        self._lock = threading.Lock()
+    
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+    
+    def set(self, *label_values, value: float):
+        with self._lock:
+            self.values[label_values] = value
+    
+    def snapshot(self) -> List[tuple]:
+        # Copied under the lock so a scrape never sees a series halfway through an update
+        with self._lock:
+            return sorted(self.values.items())
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, value in self.snapshot():
+            lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+class Gauge(Counter):
+    kind = "gauge"
+    
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+class Histogram(Counter):
+    kind = "histogram"
+    
+    def __init__(self, name: str, help_text: str, label_names: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = buckets
+    
+    def observe(self, *label_values, value: float):
+        with self._lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+    
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*label_values, value=time.perf_counter() - start)
+    
+    def snapshot(self) -> List[tuple]:
+        # Bucket lists are updated in place, so they are copied too; otherwise a bucket could run ahead of _count
+        with self._lock:
+            return sorted((label_values, (list(bucket_counts), total, count))
+                          for label_values, (bucket_counts, total, count) in self.values.items())
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        names = self.label_names + ("le",)
+        for label_values, (bucket_counts, total, count) in self.snapshot():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(names, label_values + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(names, label_values + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, label_values)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, label_values)} {count}")
+        return lines
+
+http_request_duration = Histogram("http_request_duration_seconds", "HTTP request latency by route",
+                                  ("method", "route", "status"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+mongo_operation_duration = Histogram("mongo_operation_duration_seconds", "MongoDB command latency",
+                                     ("collection", "operation"))
+mongo_operation_failures = Counter("mongo_operation_failures_total", "Failed MongoDB commands",
+                                   ("collection", "operation"))
+stage_duration = Histogram("app_stage_duration_seconds", "Time spent in in-process stages such as "
+                           "validation and rendering", ("stage",))
+notifier_duration = Histogram("notifier_send_duration_seconds", "Telegram send latency by outcome",
+                              ("outcome",))
+notifier_outcomes = Counter("notifier_outcomes_total", "Outbox delivery outcomes", ("outcome",))
+outbox_depth = Gauge("notification_outbox_depth", "Notifications waiting in the outbox", ("status",))
+cache_events = Counter("catalog_cache_events_total", "Catalog cache hits, misses and invalidations", ("event",))
+compressed_responses = Counter("http_compressed_responses_total", "Responses sent compressed, by encoding and "
+                               "whether the bytes were compressed per request or ahead of time", ("encoding", "source"))
+mongo_pool_connections = Gauge("mongo_pool_connections", "MongoDB pool connections by state",
+                               ("address", "state"))
+mongo_pool_checkout_duration = Histogram("mongo_pool_checkout_duration_seconds",
+                                         "Time spent waiting for a pooled MongoDB connection", ("address",))
+mongo_pool_checkout_failures = Counter("mongo_pool_checkout_failures_total",
+                                       "MongoDB connection checkouts that failed, e.g. a full pool timing out",
+                                       ("address", "reason"))
+rejected_requests = Counter("http_rejected_requests_total", "Requests rejected by rate and size limits "
+                            "before reaching a handler", ("route", "reason"))
+
+METRICS = [http_request_duration, http_requests_in_flight, mongo_operation_duration, mongo_operation_failures,
+           stage_duration, notifier_duration, notifier_outcomes, outbox_depth, cache_events, rejected_requests,
+           compressed_responses, mongo_pool_connections, mongo_pool_checkout_duration, mongo_pool_checkout_failures]
+
+class MongoMetricsListener(monitoring.CommandListener):
+    def __init__(self):
+        self._collections: Dict[tuple, str] = {}
+    
+    def started(self, event):
+        # getMore names its collection in a separate field; other commands use the command value
+        target = event.command.get("collection") if event.command_name == "getMore" \
+            else event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = \
+            target if isinstance(target, str) else event.database_name
+    
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), event.database_name)
+        mongo_operation_duration.observe(collection, event.command_name, value=event.duration_micros / 1e6)
+    
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), event.database_name)
+        mongo_operation_duration.observe(collection, event.command_name, value=event.duration_micros / 1e6)
+        mongo_operation_failures.inc(collection, event.command_name)
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    # Tracks open, checked out and waiting connections per server, for /metrics and /api/health
+    def __init__(self):
+        self.pools: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        # Checkouts start and finish on the same driver thread
+        self._local = threading.local()
+    
+    def _update(self, address: tuple, **changes):
+        key = f"{address[0]}:{address[1]}"
+        with self._lock:
+            pool = self.pools.setdefault(key, {"open": 0, "checked_out": 0, "waiting": 0})
+            for state, change in changes.items():
+                pool[state] = max(0, pool[state] + change)
+                mongo_pool_connections.set(key, state, value=pool[state])
+    
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {address: dict(pool) for address, pool in self.pools.items()}
+    
+    def pool_created(self, event):
+        self._update(event.address)
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        pass
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+    
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        self._update(event.address, waiting=1)
+    
+    def connection_check_out_failed(self, event):
+        self._update(event.address, waiting=-1)
+        mongo_pool_checkout_failures.inc(f"{event.address[0]}:{event.address[1]}", event.reason)
+    
+    def connection_checked_out(self, event):
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            mongo_pool_checkout_duration.observe(f"{event.address[0]}:{event.address[1]}",
+                                                 value=time.perf_counter() - started)
+        self._update(event.address, waiting=-1, checked_out=1)
+    
+    def connection_checked_in(self, event):
+        self._update(event.address, checked_out=-1)
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: no request/response wrapping, and streaming responses pass straight through
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status_code = 500
+        
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        start = time.perf_counter()
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            # The router records the matched route on the scope, so paths with ids share one series
+            route = scope.get("route")
+            http_request_duration.observe(scope["method"], getattr(route, "path", "unmatched"), status_code,
+                                          value=time.perf_counter() - start)
+
+# MongoDB client settings; unset values keep the driver defaults (or whatever MONGO_URL specifies)
+MONGO_MAX_POOL_SIZE = os.environ.get('MONGO_MAX_POOL_SIZE')
+MONGO_MIN_POOL_SIZE = os.environ.get('MONGO_MIN_POOL_SIZE')
+MONGO_MAX_IDLE_TIME_MS = os.environ.get('MONGO_MAX_IDLE_TIME_MS')
+# How long a request waits for a free pooled connection before failing instead of queueing forever
+MONGO_WAIT_QUEUE_TIMEOUT_MS = os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS')
+MONGO_SERVER_SELECTION_TIMEOUT_MS = os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS')
+MONGO_CONNECT_TIMEOUT_MS = os.environ.get('MONGO_CONNECT_TIMEOUT_MS')
+MONGO_SOCKET_TIMEOUT_MS = os.environ.get('MONGO_SOCKET_TIMEOUT_MS')
+# Wire compression in order of preference, e.g. "zstd,snappy,zlib"
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
+MONGO_ZLIB_LEVEL = os.environ.get('MONGO_ZLIB_LEVEL')
+# Catalog reads (categories, product listings) may tolerate replication lag, e.g. "secondaryPreferred".
+# A lagging secondary can then refill the catalog cache with pre-write data until the entry expires.
+MONGO_CATALOG_READ_PREFERENCE = os.environ.get('MONGO_CATALOG_READ_PREFERENCE', 'primary')
+MONGO_CATALOG_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_CATALOG_MAX_STALENESS_SECONDS', '-1'))
+# Order writes, e.g. "majority" or "1"
+MONGO_ORDER_WRITE_CONCERN = os.environ.get('MONGO_ORDER_WRITE_CONCERN')
+MONGO_ORDER_WRITE_TIMEOUT_MS = os.environ.get('MONGO_ORDER_WRITE_TIMEOUT_MS')
+MONGO_ORDER_JOURNAL = os.environ.get('MONGO_ORDER_JOURNAL')
+HEALTH_PING_TIMEOUT_SECONDS = float(os.environ.get('HEALTH_PING_TIMEOUT_SECONDS', '2'))
+# Optional modules the driver needs for each compressor
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+def mongo_client_options() -> dict:
+    options = {}
+    for option, value in (("maxPoolSize", MONGO_MAX_POOL_SIZE), ("minPoolSize", MONGO_MIN_POOL_SIZE),
+                          ("maxIdleTimeMS", MONGO_MAX_IDLE_TIME_MS), ("waitQueueTimeoutMS", MONGO_WAIT_QUEUE_TIMEOUT_MS),
+                          ("serverSelectionTimeoutMS", MONGO_SERVER_SELECTION_TIMEOUT_MS),
+                          ("connectTimeoutMS", MONGO_CONNECT_TIMEOUT_MS), ("socketTimeoutMS", MONGO_SOCKET_TIMEOUT_MS),
+                          ("zlibCompressionLevel", MONGO_ZLIB_LEVEL)):
+        if value:
+            options[option] = int(value)
+    
+    compressors = []
+    for name in (name.strip() for name in MONGO_COMPRESSORS.split(",") if name.strip()):
+        if name in COMPRESSOR_MODULES and importlib.util.find_spec(COMPRESSOR_MODULES[name]) is not None:
+            compressors.append(name)
+        else:
+            print(f"MongoDB compressor {name} is unavailable, skipping it")
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+def catalog_read_preference():
+    modes = {"primary": Primary, "primaryPreferred": PrimaryPreferred, "secondary": Secondary,
+             "secondaryPreferred": SecondaryPreferred, "nearest": Nearest}
+    mode = modes[MONGO_CATALOG_READ_PREFERENCE]
+    if mode is Primary:
+        return Primary()
+    return mode(max_staleness=MONGO_CATALOG_MAX_STALENESS_SECONDS)
+
+def order_write_concern() -> Optional[WriteConcern]:
+    if not MONGO_ORDER_WRITE_CONCERN:
+        return None
+    w = int(MONGO_ORDER_WRITE_CONCERN) if MONGO_ORDER_WRITE_CONCERN.isdigit() else MONGO_ORDER_WRITE_CONCERN
+    wtimeout = int(MONGO_ORDER_WRITE_TIMEOUT_MS) if MONGO_ORDER_WRITE_TIMEOUT_MS else None
+    journal = MONGO_ORDER_JOURNAL.lower() in ('1', 'true', 'yes') if MONGO_ORDER_JOURNAL else None
+    return WriteConcern(w=w, wtimeout=wtimeout, j=journal)
+
+ORDER_WRITE_CONCERN = order_write_concern()
 
 # MongoDB connection
-client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
+mongo_pool_listener = MongoPoolListener()
+client = AsyncIOMotorClient(os.environ.get('MONGO_URL'), event_listeners=[MongoMetricsListener(), mongo_pool_listener],
+                            **mongo_client_options())
+# Resolved from MONGO_URL and the settings above, for the health report
+mongo_max_pool_size = client.options.pool_options.max_pool_size
 db = client["pempek_domino"]
 collection_products = db["products"]
-collection_orders = db["orders"]
+collection_orders = db.get_collection("orders", write_concern=ORDER_WRITE_CONCERN)
 collection_categories = db["categories"]
+# Read-only handles for the public catalog loaders; writes and checkout pricing stay on the primary
+collection_catalog_products = collection_products.with_options(read_preference=catalog_read_preference())
+collection_catalog_categories = collection_categories.with_options(read_preference=catalog_read_preference())
+collection_outbox = db["notification_outbox"]
+collection_dead_letters = db["notification_dead_letters"]
+collection_idempotency_keys = db["idempotency_keys"]
+collection_revoked_tokens = db["admin_revoked_tokens"]
+collection_stream_tickets = db["admin_stream_tickets"]
+collection_sales_daily = db["sales_daily"]
+collection_rate_limits = db["rate_limits"]
+collection_app_state = db["app_state"]
+collection_cluster_events = db["cluster_events"]
+
+# Set at startup once we know whether the deployment is a replica set
+supports_transactions = False
+
+# Multi-worker settings
+STARTUP_LOCK_LEASE_SECONDS = float(os.environ.get('STARTUP_LOCK_LEASE_SECONDS', '60'))
+# Set by gunicorn.conf.py: workers tell each other about catalog writes, logouts and order events
+CLUSTER_BROADCAST = os.environ.get('CLUSTER_BROADCAST', 'false').lower() in ('1', 'true', 'yes')
+CLUSTER_EVENTS_BYTES = int(os.environ.get('CLUSTER_EVENTS_BYTES', str(1024 * 1024)))
+CLUSTER_POLL_SECONDS = float(os.environ.get('CLUSTER_POLL_SECONDS', '1'))
+SAMPLE_DATA_NAMESPACE = uuid.UUID("6f1c2a3e-8d4b-4f7a-9c1e-2b5d7e9f0a13")
+
+# Notification outbox settings
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '20'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_BASE_DELAY_SECONDS = float(os.environ.get('OUTBOX_BASE_DELAY_SECONDS', '2'))
+OUTBOX_MAX_DELAY_SECONDS = float(os.environ.get('OUTBOX_MAX_DELAY_SECONDS', '600'))
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.environ.get('OUTBOX_POLL_INTERVAL_SECONDS', '5'))
+# Must outlast one Telegram send, i.e. the pool, connect, write and read timeouts together
+OUTBOX_LEASE_SECONDS = float(os.environ.get('OUTBOX_LEASE_SECONDS', '60'))
+
+outbox_wakeup = asyncio.Event()
+outbox_dispatcher_task = None
+
+# Category consistency settings
+CATEGORY_RECONCILE_INTERVAL_SECONDS = float(os.environ.get('CATEGORY_RECONCILE_INTERVAL_SECONDS', '3600'))
+
+category_reconciler_task = None
+
+# Outbound HTTP settings (Telegram)
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_MAX_CONNECTIONS = int(os.environ.get('TELEGRAM_MAX_CONNECTIONS', '10'))
+TELEGRAM_MAX_KEEPALIVE = int(os.environ.get('TELEGRAM_MAX_KEEPALIVE', '5'))
+TELEGRAM_MAX_CONCURRENCY = int(os.environ.get('TELEGRAM_MAX_CONCURRENCY', '4'))
+TELEGRAM_CONNECT_TIMEOUT = float(os.environ.get('TELEGRAM_CONNECT_TIMEOUT', '5'))
+TELEGRAM_READ_TIMEOUT = float(os.environ.get('TELEGRAM_READ_TIMEOUT', '10'))
+TELEGRAM_POOL_TIMEOUT = float(os.environ.get('TELEGRAM_POOL_TIMEOUT', '5'))
+
+# Admin token settings
+ADMIN_TOKEN_TTL_SECONDS = int(os.environ.get('ADMIN_TOKEN_TTL_SECONDS', str(12 * 60 * 60)))
+ADMIN_TOKEN_CACHE_SIZE = int(os.environ.get('ADMIN_TOKEN_CACHE_SIZE', '1024'))
+# Single-use tickets for the order stream, so the admin token never appears in a URL
+STREAM_TICKET_TTL_SECONDS = int(os.environ.get('STREAM_TICKET_TTL_SECONDS', '30'))
+
+# Idempotency settings
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 60 * 60)))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', '10'))
+# An in-progress claim older than this is treated as abandoned (its process died) and can be taken over
+IDEMPOTENCY_LEASE_SECONDS = float(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '120'))
+
+# Bulk product import settings
+PRODUCT_IMPORT_MAX_ROWS = int(os.environ.get('PRODUCT_IMPORT_MAX_ROWS', '1000'))
+
+# Product image settings
+MEDIA_ROOT = Path(os.environ.get('MEDIA_ROOT', Path(__file__).resolve().parent / "media"))
+MEDIA_URL_PREFIX = "/api/media"
+IMAGE_VARIANT_WIDTHS = tuple(int(width) for width in os.environ.get('IMAGE_VARIANT_WIDTHS', '320,640,1280').split(","))
+IMAGE_MAX_UPLOAD_BYTES = int(os.environ.get('IMAGE_MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '2'))
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Admin order feed settings
+ORDER_FEED_BUFFER_SIZE = int(os.environ.get('ORDER_FEED_BUFFER_SIZE', '500'))
+ORDER_FEED_QUEUE_SIZE = int(os.environ.get('ORDER_FEED_QUEUE_SIZE', '100'))
+ORDER_FEED_KEEPALIVE_SECONDS = float(os.environ.get('ORDER_FEED_KEEPALIVE_SECONDS', '15'))
+
+# Admin order listing settings
+ADMIN_ORDERS_DEFAULT_LIMIT = int(os.environ.get('ADMIN_ORDERS_DEFAULT_LIMIT', '50'))
+ADMIN_ORDERS_MAX_LIMIT = int(os.environ.get('ADMIN_ORDERS_MAX_LIMIT', '200'))
+ORDER_EXPORT_BATCH_SIZE = int(os.environ.get('ORDER_EXPORT_BATCH_SIZE', '500'))
+
+# Product search settings
+SEARCH_DEFAULT_LIMIT = int(os.environ.get('SEARCH_DEFAULT_LIMIT', '20'))
+SEARCH_MAX_LIMIT = int(os.environ.get('SEARCH_MAX_LIMIT', '100'))
+
+# Request limit settings
+# "memory" keeps buckets per worker; "mongo" shares them between workers and instances
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '10000'))
+# Number of reverse proxies in front of the app whose X-Forwarded-For entries are trusted
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '0'))
+ORDER_RATE_PER_IP = os.environ.get('ORDER_RATE_PER_IP', '10/60,5')
+ORDER_RATE_PER_PHONE = os.environ.get('ORDER_RATE_PER_PHONE', '5/60,3')
+LOGIN_RATE_PER_IP = os.environ.get('LOGIN_RATE_PER_IP', '10/60,5')
+ORDER_MAX_BODY_BYTES = int(os.environ.get('ORDER_MAX_BODY_BYTES', str(16 * 1024)))
+LOGIN_MAX_BODY_BYTES = int(os.environ.get('LOGIN_MAX_BODY_BYTES', '1024'))
+ORDER_MAX_ITEMS = int(os.environ.get('ORDER_MAX_ITEMS', '50'))
+ORDER_MAX_QUANTITY = int(os.environ.get('ORDER_MAX_QUANTITY', '100'))
+
+# Response compression settings
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+# Per-request levels favour speed; cached payloads are compressed once at the highest levels
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_LEVEL = int(os.environ.get('BROTLI_LEVEL', '4'))
+# Bodies above this size are compressed in a worker thread so the event loop keeps serving
+COMPRESSION_THREAD_BYTES = int(os.environ.get('COMPRESSION_THREAD_BYTES', str(256 * 1024)))
+
+# Catalog cache settings
+CATALOG_CACHE_TTL_SECONDS = float(os.environ.get('CATALOG_CACHE_TTL_SECONDS', '300'))
+CATALOG_CACHE_CONTROL = os.environ.get('CATALOG_CACHE_CONTROL',
+                                       'public, max-age=0, s-maxage=30, stale-while-revalidate=60')
+
+http_client: Optional[httpx.AsyncClient] = None
+telegram_semaphore = asyncio.Semaphore(TELEGRAM_MAX_CONCURRENCY)
 
 # Security
 security = HTTPBearer()
 
+# Request limits
+def parse_rate(value: str) -> tuple:
+    # "<requests>/<seconds>,<burst>" -> (tokens refilled per second, bucket size)
+    rate, _, burst = value.partition(",")
+    requests, _, seconds = rate.partition("/")
+    return float(requests) / float(seconds or 1), float(burst or requests)
+
+class MemoryRateLimiter:
+    # Token buckets for one worker; the least recently seen clients are evicted past max_keys
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()
+    
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        # Returns 0 when a token was taken, otherwise the seconds until one is available
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+class MongoRateLimiter:
+    # Token buckets shared by every worker: one atomic pipeline update per check, expired by a TTL index
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.time()
+        refilled = {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]},
+                                             {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]},
+                                                            rate]}]}]}
+        bucket = await collection_rate_limits.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated": now,
+                          "expires_at": datetime.now(timezone.utc) + timedelta(seconds=burst / rate)}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+            ],
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return 0.0 if bucket["allowed"] else (1 - bucket["tokens"]) / rate
+
+def create_rate_limiter():
+    if RATE_LIMIT_BACKEND == "mongo":
+        return MongoRateLimiter()
+    return MemoryRateLimiter(RATE_LIMIT_MAX_KEYS)
+
+rate_limiter = create_rate_limiter()
+
+class RequestRejected(Exception):
+    def __init__(self, status_code: int, reason: str, detail: str, retry_after: float = 0):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.reason = reason
+        self.detail = detail
+        self.retry_after = retry_after
+
+def order_limit_keys(body: bytes) -> List[tuple]:
+    # Only the fields the limits need; full validation stays with the OrderRequest model
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return []
+    if not isinstance(payload, dict):
+        return []
+    items = payload.get("items")
+    if isinstance(items, list) and len(items) > ORDER_MAX_ITEMS:
+        raise RequestRejected(422, "too_many_items", f"At most {ORDER_MAX_ITEMS} items per order")
+    phone = "".join(char for char in str(payload.get("customer_phone") or "") if char.isdigit())
+    return [("phone", phone, parse_rate(ORDER_RATE_PER_PHONE))] if phone else []
+
+# (method, path) -> (max body bytes, per-IP rate, inspector for body-derived limits)
+LIMITED_ROUTES = {
+    ("POST", "/api/orders"): (ORDER_MAX_BODY_BYTES, parse_rate(ORDER_RATE_PER_IP), order_limit_keys),
+    ("POST", "/api/admin/login"): (LOGIN_MAX_BODY_BYTES, parse_rate(LOGIN_RATE_PER_IP), None),
+}
+
+def client_ip(scope) -> str:
+    if TRUSTED_PROXY_HOPS:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                hops = [hop.strip() for hop in value.decode("latin-1").split(",")]
+                return hops[max(0, len(hops) - TRUSTED_PROXY_HOPS)]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+class RequestLimitMiddleware:
+    # Rejects before the body is parsed by FastAPI: rate first (no body read), then size, then body limits
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        limits = LIMITED_ROUTES.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if limits is None:
+            await self.app(scope, receive, send)
+            return
+        
+        max_bytes, ip_rate, inspect = limits
+        route = scope["path"]
+        try:
+            await self.check_rate(f"ip:{route}:{client_ip(scope)}", ip_rate, "rate_limited_ip")
+            
+            content_length = next((value for name, value in scope["headers"] if name == b"content-length"), None)
+            if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+                raise RequestRejected(413, "body_too_large", f"Request body larger than {max_bytes} bytes")
+            body = await self.read_body(receive, max_bytes)
+            
+            if inspect is not None:
+                for kind, value, rate in inspect(body):
+                    await self.check_rate(f"{kind}:{route}:{value}", rate, f"rate_limited_{kind}")
+        except RequestRejected as e:
+            rejected_requests.inc(route, e.reason)
+            # The router never sees the request, so record the route it was aimed at for the latency metrics
+            scope["route"] = next((candidate for candidate in app.router.routes
+                                   if getattr(candidate, "path", None) == route), None)
+            headers = {"Retry-After": str(max(1, int(e.retry_after + 0.999)))} if e.retry_after else None
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=headers)
+            await response(scope, receive, send)
+            return
+        
+        replayed = False
+        
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+        
+        await self.app(scope, replay, send)
+    
+    async def check_rate(self, key: str, rate: tuple, reason: str):
+        wait = await rate_limiter.take(key, *rate)
+        if wait:
+            raise RequestRejected(429, reason, "Too many requests, please try again later", retry_after=wait)
+    
+    async def read_body(self, receive, max_bytes: int) -> bytes:
+        # Content-Length can be absent (chunked) or wrong, so the running total is enforced too
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise RequestRejected(400, "disconnected", "Client disconnected")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > max_bytes:
+                raise RequestRejected(413, "body_too_large", f"Request body larger than {max_bytes} bytes")
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+# Response compression
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript", "image/svg+xml")
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    # Brotli when the client takes it (and the module is installed), else gzip, else nothing
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        weights[coding.strip().lower()] = quality
+    wildcard = weights.get("*", 0.0)
+    for coding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if weights.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+def compress_body(body: bytes, encoding: str, best: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if best else BROTLI_LEVEL)
+    compressor = zlib.compressobj(9 if best else GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+class StreamCompressor:
+    # For streamed responses (order export): each chunk is flushed so rows still arrive as they are read
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_LEVEL)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(chunk) + self._brotli.flush()
+        return self._zlib.compress(chunk) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+    
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";")[0].strip().lower()
+    # Event streams must reach the browser unbuffered
+    if media_type == "text/event-stream":
+        return False
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+class CompressionMiddleware:
+    # Plain ASGI like the others, so streaming responses are compressed chunk by chunk instead of buffered
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = next((value.decode("latin-1") for name, value in scope["headers"]
+                                if name == b"accept-encoding"), None)
+        encoding = negotiate_encoding(accept_encoding)
+        
+        start_message = None
+        compressor = None
+        
+        async def send_compressed(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                headers = {name.lower(): value for name, value in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in headers or not is_compressible(content_type):
+                    await send(message)
+                    return
+                # Held back until the first body chunk shows whether compressing is worth it
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is not None:
+                chunk = compressor.compress(body) if body else b""
+                if not more_body:
+                    chunk += compressor.finish()
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                return
+            
+            # The response depends on Accept-Encoding whether or not this one ends up compressed
+            headers = list(start_message.get("headers", []))
+            vary = b", ".join(value for name, value in headers if name.lower() == b"vary")
+            if b"accept-encoding" not in vary.lower():
+                headers = [(name, value) for name, value in headers if name.lower() != b"vary"]
+                headers.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+            start = dict(start_message, headers=headers)
+            
+            if encoding is None or start_message["status"] in (204, 304) or \
+                    (not more_body and len(body) < COMPRESSION_MIN_BYTES):
+                await send(start)
+                await send(message)
+                start_message = None
+                return
+            
+            headers = [(name, value) for name, value in headers if name.lower() != b"content-length"]
+            headers.append((b"content-encoding", encoding.encode()))
+            if more_body:
+                compressor = StreamCompressor(encoding)
+                chunk = compressor.compress(body) if body else b""
+            else:
+                if len(body) > COMPRESSION_THREAD_BYTES:
+                    chunk = await asyncio.to_thread(compress_body, body, encoding)
+                else:
+                    chunk = compress_body(body, encoding)
+                headers.append((b"content-length", str(len(chunk)).encode()))
+            compressed_responses.inc(encoding, "dynamic")
+            await send(dict(start, headers=headers))
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+        
+        await self.app(scope, receive, send_compressed)
+
+app.add_middleware(RequestLimitMiddleware)
+# CORS setup; outside the limits so browsers can read their 413/422/429 responses
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(CompressionMiddleware)
+# Added last so it is outermost and also times requests rejected by the limits
+app.add_middleware(MetricsMiddleware)
+
 # Pydantic models
 class Category(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -50,6 +788,8 @@ class Product(BaseModel):
     image_url: str
     stock: int = 100
     description: Optional[str] = ""
+    # "<format>_<width>" -> URL of a resized variant, e.g. "webp_320"
+    image_variants: Dict[str, str] = {}
 
 class Order(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -60,24 +800,139 @@ class Order(BaseModel):
     total_amount: int
     status: str = "pending"
     created_at: str = Field(default_factory=lambda: datetime.now().isoformat())
+    updated_at: Optional[str] = None
+
+OrderStatus = Literal["pending", "confirmed", "cooking", "delivered", "cancelled"]
+
+class OrderStatusUpdate(BaseModel):
+    status: OrderStatus
+
+class BulkOrderStatusUpdate(BaseModel):
+    order_ids: List[str] = Field(..., min_length=1, max_length=500)
+    status: OrderStatus
+
+class OrderItemRequest(BaseModel):
+    id: str = Field(..., max_length=64)
+    quantity: int = Field(..., ge=1, le=ORDER_MAX_QUANTITY)
+
+# What the storefront submits; names, prices and totals are taken from the database
+class OrderRequest(BaseModel):
+    customer_name: str = Field(..., max_length=100)
+    customer_phone: str = Field(..., max_length=30)
+    customer_address: str = Field(..., max_length=500)
+    items: List[OrderItemRequest] = Field(..., min_length=1, max_length=ORDER_MAX_ITEMS)
+
+class CategoryUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
 
 class LoginRequest(BaseModel):
     username: str
     password: str
 
 # Admin authentication
-def verify_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    admin_username = os.environ.get('ADMIN_USERNAME')
-    admin_password = os.environ.get('ADMIN_PASSWORD')
+class AdminAuth:
+    # Credentials and signing key are read once, not per request
+    def __init__(self):
+        self.username = os.environ.get('ADMIN_USERNAME') or ""
+        self.password = os.environ.get('ADMIN_PASSWORD') or ""
+        # Without ADMIN_JWT_SECRET the key is generated once at bootstrap and loaded by load_secret()
+        self.secret = os.environ.get('ADMIN_JWT_SECRET') or None
+        # token -> (expires_at, jti) for tokens whose signature has already been checked
+        self.validated: OrderedDict = OrderedDict()
+        # jti -> expires_at
+        self.revoked: Dict[str, float] = {}
+    
+    async def load_secret(self):
+        if not self.secret:
+            state = await collection_app_state.find_one({"_id": "bootstrap"}, {"_id": 0, "admin_jwt_secret": 1})
+            self.secret = (state or {}).get("admin_jwt_secret")
+    
+    def check_credentials(self, username: str, password: str) -> bool:
+        if not self.username or not self.password:
+            return False
+        username_ok = hmac.compare_digest(username.encode(), self.username.encode())
+        password_ok = hmac.compare_digest(password.encode(), self.password.encode())
+        return username_ok and password_ok
+    
+    def issue_token(self) -> tuple:
+        now = int(time.time())
+        expires_at = now + ADMIN_TOKEN_TTL_SECONDS
+        claims = {"sub": self.username, "scope": "admin", "iat": now, "exp": expires_at, "jti": uuid.uuid4().hex}
+        return jwt.encode(claims, self.secret, algorithm="HS256"), expires_at
     
-    if not credentials.credentials:
+    def decode(self, token: str) -> Optional[dict]:
+        if not self.secret:
+            return None
+        try:
+            claims = jwt.decode(token, self.secret, algorithms=["HS256"],
+                                options={"require": ["exp", "jti", "sub"]})
+        except jwt.PyJWTError:
+            return None
+        if claims.get("scope") != "admin" or not hmac.compare_digest(claims["sub"], self.username):
+            return None
+        return claims
+    
+    def verify(self, token: str) -> bool:
+        cached = self.validated.get(token)
+        if cached is not None:
+            expires_at, jti = cached
+            if expires_at > time.time() and jti not in self.revoked:
+                # Least recently used tokens are the ones evicted when the cache is full
+                self.validated.move_to_end(token)
+                return True
+            self.validated.pop(token, None)
+            return False
+        
+        claims = self.decode(token)
+        if claims is None or claims["jti"] in self.revoked:
+            return False
+        self.validated[token] = (claims["exp"], claims["jti"])
+        if len(self.validated) > ADMIN_TOKEN_CACHE_SIZE:
+            self.validated.popitem(last=False)
+        return True
+    
+    def revoke(self, jti: str, expires_at: float):
+        self.revoked[jti] = expires_at
+        now = time.time()
+        for stale in [key for key, value in self.revoked.items() if value <= now]:
+            del self.revoked[stale]
+        for token in [token for token, (_, cached_jti) in self.validated.items() if cached_jti == jti]:
+            del self.validated[token]
+
+admin_auth = AdminAuth()
+
+async def load_revoked_tokens():
+    now = datetime.now(timezone.utc)
+    async for entry in collection_revoked_tokens.find({"expires_at": {"$gt": now}}, {"_id": 0}):
+        admin_auth.revoke(entry["jti"], entry["expires_at"].replace(tzinfo=timezone.utc).timestamp())
+
+async def verify_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    # async so the check runs on the event loop instead of a threadpool hop
+    if not credentials.credentials or not admin_auth.verify(credentials.credentials):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials"
         )
-    
-    # Simple token check (in real app, use JWT)
-    if credentials.credentials != f"{admin_username}:{admin_password}":
+    return True
+
+async def consume_stream_ticket(ticket: str) -> bool:
+    # Deleting the ticket is what redeems it, so it works on any worker and only once
+    result = await collection_stream_tickets.delete_one(
+        {"ticket": ticket, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+    )
+    return result.deleted_count == 1
+
+async def verify_admin_stream(
+    ticket: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))
+):
+    # EventSource can't set headers, so browsers pass a single-use ticket from POST .../stream-ticket instead
+    if credentials:
+        verified = admin_auth.verify(credentials.credentials)
+    else:
+        verified = bool(ticket) and await consume_stream_ticket(ticket)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials"
@@ -85,20 +940,20 @@ def verify_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
     return True
 
 # Telegram notification function
-async def send_telegram_notification(order: Order):
-    try:
-        bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
-        chat_id = os.environ.get('TELEGRAM_CHAT_ID')
-        
-        if not bot_token or not chat_id:
-            print("Telegram credentials not configured")
-            return
-        
-        # Format order details
-        items_text = "\n".join([f"• {item['name']} x{item['quantity']} = Rp {item['subtotal']:,}" 
-                               for item in order.items])
-        
-        message = f"""🍽️ *PESANAN BARU PEMPEK DOMINO* 🍽️
+class NotificationError(Exception):
+    def __init__(self, message: str, retryable: bool = True, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+def telegram_configured() -> bool:
+    return bool(os.environ.get('TELEGRAM_BOT_TOKEN') and os.environ.get('TELEGRAM_CHAT_ID'))
+
+def format_order_message(order: Order) -> str:
+    items_text = "\n".join([f"• {item['name']} x{item['quantity']} = Rp {item['subtotal']:,}" 
+                           for item in order.items])
+    
+    return f"""🍽️ *PESANAN BARU PEMPEK DOMINO* 🍽️
 
 👤 *Pelanggan:* {order.customer_name}
 📱 *Telepon:* {order.customer_phone}
@@ -112,144 +967,1980 @@ async def send_telegram_notification(order: Order):
 
 Status: ⏳ Menunggu Konfirmasi"""
 
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        payload = {
-            "chat_id": chat_id,
-            "text": message,
-            "parse_mode": "Markdown"
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        # HTTP/2 needs the optional h2 package; fall back to pooled HTTP/1.1 keep-alive without it
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=TELEGRAM_MAX_CONNECTIONS,
+            max_keepalive_connections=TELEGRAM_MAX_KEEPALIVE,
+            keepalive_expiry=30,
+        ),
+        timeout=httpx.Timeout(
+            connect=TELEGRAM_CONNECT_TIMEOUT,
+            read=TELEGRAM_READ_TIMEOUT,
+            write=TELEGRAM_READ_TIMEOUT,
+            pool=TELEGRAM_POOL_TIMEOUT,
+        ),
+    )
+
+def get_http_client() -> httpx.AsyncClient:
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = create_http_client()
+    return http_client
+
+async def send_telegram_message(text: str):
+    bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
+    chat_id = os.environ.get('TELEGRAM_CHAT_ID')
+    
+    url = f"{TELEGRAM_API_URL}/bot{bot_token}/sendMessage"
+    payload = {
+        "chat_id": chat_id,
+        "text": text,
+        "parse_mode": "Markdown"
+    }
+    
+    try:
+        # Bounds in-flight sends so a burst of orders can't open unbounded sockets
+        async with telegram_semaphore:
+            response = await get_http_client().post(url, json=payload)
+    except httpx.HTTPError as e:
+        raise NotificationError(f"Telegram request failed: {e}")
+    
+    if response.status_code == 200:
+        return
+    if response.status_code == 429:
+        retry_after = response.json().get("parameters", {}).get("retry_after")
+        raise NotificationError(f"Telegram rate limited: {response.text}", retry_after=retry_after)
+    # Other 4xx responses (bad chat id, malformed markdown) will fail the same way on retry
+    raise NotificationError(f"Telegram rejected message: {response.text}",
+                            retryable=response.status_code >= 500)
+
+# Notification outbox
+# Claim no more than can be sent at once: every claimed entry starts sending straight away, so a claim
+# only has to outlast one send (bounded by the Telegram timeouts), not a queue of them, before its lease ends
+OUTBOX_CLAIM_SIZE = min(OUTBOX_BATCH_SIZE, TELEGRAM_MAX_CONCURRENCY)
+
+def new_outbox_entry(kind: str, ref_id: str, text: str) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "ref_id": ref_id,
+        "text": text,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "lease_until": None,
+        "claim_id": None,
+        "last_error": None,
+        "created_at": now,
+    }
+
+def outbox_backoff_seconds(attempts: int) -> float:
+    delay = min(OUTBOX_MAX_DELAY_SECONDS, OUTBOX_BASE_DELAY_SECONDS * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+async def claim_outbox_batch() -> List[dict]:
+    now = datetime.now(timezone.utc)
+    # Entries left in "sending" by a crashed process become claimable once their lease expires
+    due_filter = {"$or": [
+        {"status": "pending", "next_attempt_at": {"$lte": now}},
+        {"status": "sending", "lease_until": {"$lte": now}},
+    ]}
+    due = await collection_outbox.find(due_filter, {"_id": 0, "id": 1}) \
+        .sort("next_attempt_at", 1).limit(OUTBOX_CLAIM_SIZE).to_list(length=OUTBOX_CLAIM_SIZE)
+    if not due:
+        return []
+    
+    claim_id = str(uuid.uuid4())
+    await collection_outbox.update_many(
+        {"id": {"$in": [entry["id"] for entry in due]}, **due_filter},
+        {"$set": {"status": "sending", "claim_id": claim_id,
+                  "lease_until": now + timedelta(seconds=OUTBOX_LEASE_SECONDS)}}
+    )
+    return await collection_outbox.find({"claim_id": claim_id}, {"_id": 0}).to_list(length=OUTBOX_CLAIM_SIZE)
+
+async def deliver_outbox_entry(entry: dict) -> List:
+    # Writes are scoped to our claim: if the lease ran out and another worker took the entry, it is theirs now
+    claimed = {"id": entry["id"], "claim_id": entry["claim_id"]}
+    start = time.perf_counter()
+    try:
+        await send_telegram_message(entry["text"])
+        notifier_duration.observe("sent", value=time.perf_counter() - start)
+        notifier_outcomes.inc("sent")
+        return [DeleteOne(claimed)]
+    except NotificationError as e:
+        error, retryable, retry_after = str(e), e.retryable, e.retry_after
+    except Exception as e:
+        error, retryable, retry_after = f"Unexpected error: {e}", True, None
+    notifier_duration.observe("failed", value=time.perf_counter() - start)
+    
+    attempts = entry["attempts"] + 1
+    if not retryable or attempts >= OUTBOX_MAX_ATTEMPTS:
+        notifier_outcomes.inc("dead_lettered")
+        print(f"Notification {entry['id']} dead-lettered after {attempts} attempt(s): {error}")
+        dead_letter = {**entry, "attempts": attempts, "status": "dead", "last_error": error,
+                       "failed_at": datetime.now(timezone.utc)}
+        return [DeleteOne(claimed), InsertOne(dead_letter)]
+    
+    notifier_outcomes.inc("retried")
+    delay = max(retry_after or 0, outbox_backoff_seconds(attempts))
+    print(f"Notification {entry['id']} failed (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+    return [UpdateOne(claimed, {"$set": {
+        "status": "pending",
+        "attempts": attempts,
+        "next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=delay),
+        "lease_until": None,
+        "claim_id": None,
+        "last_error": error,
+    }})]
+
+async def dispatch_outbox_batch() -> int:
+    entries = await claim_outbox_batch()
+    if not entries:
+        return 0
+    
+    outcomes = await asyncio.gather(*[deliver_outbox_entry(entry) for entry in entries])
+    outbox_ops = [op for ops in outcomes for op in ops if not isinstance(op, InsertOne)]
+    dead_letters = [op for ops in outcomes for op in ops if isinstance(op, InsertOne)]
+    if dead_letters:
+        await collection_dead_letters.bulk_write(dead_letters, ordered=False)
+    await collection_outbox.bulk_write(outbox_ops, ordered=False)
+    return len(entries)
+
+async def requeue_unqueued_orders() -> int:
+    # Without transactions an order can be stored while its outbox insert fails; queue those here
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=OUTBOX_LEASE_SECONDS)
+    orders = await collection_orders.find({"outbox_pending_since": {"$lte": cutoff}}, ORDER_PROJECTION) \
+        .to_list(length=OUTBOX_BATCH_SIZE)
+    requeued = 0
+    for order_doc in orders:
+        # Clearing the marker first claims the order, so two workers never queue it twice
+        claimed = await collection_orders.update_one(
+            {"id": order_doc["id"], "outbox_pending_since": {"$exists": True}},
+            {"$unset": {"outbox_pending_since": ""}}
+        )
+        if not claimed.modified_count:
+            continue
+        order = Order(**order_doc)
+        try:
+            await collection_outbox.insert_one(new_outbox_entry("new_order", order.id, format_order_message(order)))
+        except Exception:
+            await collection_orders.update_one({"id": order.id},
+                                               {"$set": {"outbox_pending_since": datetime.now(timezone.utc)}})
+            raise
+        print(f"Queued missing notification for order {order.id}")
+        requeued += 1
+    return requeued
+
+async def run_outbox_dispatcher():
+    while True:
+        try:
+            if not supports_transactions:
+                await requeue_unqueued_orders()
+            processed = await dispatch_outbox_batch()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error dispatching notifications: {e}")
+            processed = 0
+        
+        # A full batch means there is probably more waiting, so go again straight away
+        if processed < OUTBOX_CLAIM_SIZE:
+            try:
+                await asyncio.wait_for(outbox_wakeup.wait(), timeout=OUTBOX_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            outbox_wakeup.clear()
+
+async def detect_transaction_support() -> bool:
+    try:
+        hello = await client.admin.command("hello")
+        return "setName" in hello or hello.get("msg") == "isdbgrid"
+    except Exception as e:
+        print(f"Could not determine transaction support: {e}")
+        return False
+
+# Catalog cache
+class TTLCache:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Hashable, tuple] = {}
+        # key -> [lock, holders and waiters]
+        self._locks: Dict[Hashable, list] = {}
+        # Bumped on every invalidation so a load that raced a write is not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+    
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+    
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        
+        # Only one coroutine per key goes to the database; the rest wait for its result.
+        # Locks are counted and dropped once nobody holds or waits on them, so they don't pile up per key.
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                value = self.get(key)
+                if value is not None:
+                    self.hits += 1
+                    return value
+                self.misses += 1
+                generation = self._generation
+                value = await loader()
+                if generation == self._generation:
+                    self.set(key, value)
+                return value
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+    
+    def invalidate(self):
+        self._entries.clear()
+        self._generation += 1
+        self.invalidations += 1
+    
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "ttl_seconds": self.ttl_seconds,
         }
+
+catalog_cache = TTLCache(CATALOG_CACHE_TTL_SECONDS)
+
+def render_json(data: Any) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def json_response(data: Any) -> Response:
+    return Response(content=render_json(data), media_type="application/json")
+
+class CachedPayload:
+    # JSON rendered and compressed once per catalog change, plus a strong ETag over the bytes
+    def __init__(self, data: Any):
+        with stage_duration.time("render_catalog"):
+            self.body = render_json(data)
+        self.etag = f'"{hashlib.blake2b(self.body, digest_size=16).hexdigest()}"'
+        self.encoded: Dict[str, bytes] = {}
+        if len(self.body) >= COMPRESSION_MIN_BYTES:
+            with stage_duration.time("compress_catalog"):
+                for encoding in (("gzip", "br") if brotli is not None else ("gzip",)):
+                    self.encoded[encoding] = compress_body(self.body, encoding, best=True)
+    
+    def etag_for(self, encoding: Optional[str]) -> str:
+        # Each encoding is a different representation, so it gets its own validator
+        return f'{self.etag[:-1]}-{encoding}"' if encoding else self.etag
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def cached_json_response(request: Request, payload: CachedPayload) -> Response:
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding not in payload.encoded:
+        encoding = None
+    etag = payload.etag_for(encoding)
+    headers = {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if encoding is None:
+        return Response(content=payload.body, media_type="application/json", headers=headers)
+    
+    # The middleware leaves responses that already carry a Content-Encoding alone
+    compressed_responses.inc(encoding, "precompressed")
+    headers["Content-Encoding"] = encoding
+    return Response(content=payload.encoded[encoding], media_type="application/json", headers=headers)
+
+# Product search
+class ProductSearchIndex:
+    # Inverted index over name, category and description, kept in memory so typeahead never touches Mongo.
+    # Terms are folded to lowercase ASCII ("Pémpek" -> "pempek") and any query term may be a prefix.
+    FIELD_WEIGHTS = (("name", 3.0), ("category_name", 2.0), ("description", 1.0))
+    TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+    
+    def __init__(self):
+        self._products: Dict[str, dict] = {}
+        self._names: Dict[str, str] = {}
+        # term -> {product id: weight}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        # Sorted vocabulary, so every term sharing a prefix is one contiguous slice
+        self._terms: List[str] = []
+    
+    @classmethod
+    def tokenize(cls, text: Optional[str]) -> List[str]:
+        if not text:
+            return []
+        decomposed = unicodedata.normalize("NFKD", text)
+        folded = "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+        return cls.TOKEN_PATTERN.findall(folded)
+    
+    def _add_posting(self, term: str, product_id: str, weight: float):
+        postings = self._postings.get(term)
+        if postings is None:
+            postings = self._postings[term] = {}
+            insort(self._terms, term)
+        postings[product_id] = max(postings.get(product_id, 0.0), weight)
+    
+    def upsert(self, product: dict):
+        self.remove(product["id"])
+        self._products[product["id"]] = product
+        self._names[product["id"]] = " ".join(self.tokenize(product.get("name")))
+        for field, weight in self.FIELD_WEIGHTS:
+            for term in self.tokenize(product.get(field)):
+                self._add_posting(term, product["id"], weight)
+    
+    def remove(self, product_id: str):
+        product = self._products.pop(product_id, None)
+        self._names.pop(product_id, None)
+        if product is None:
+            return
+        for field, _ in self.FIELD_WEIGHTS:
+            for term in self.tokenize(product.get(field)):
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[term]
+                    del self._terms[bisect_left(self._terms, term)]
+    
+    def adjust_stock(self, quantities: Dict[str, int], sign: int):
+        # Orders and cancellations move stock without an admin write; mirror them here
+        for product_id, quantity in quantities.items():
+            product = self._products.get(product_id)
+            if product is not None:
+                product["stock"] = max(0, product.get("stock", 0) + sign * quantity)
+    
+    def rebuild(self, products: List[dict]):
+        self._products.clear()
+        self._names.clear()
+        self._postings.clear()
+        self._terms.clear()
+        for product in products:
+            self.upsert(product)
+    
+    def _term_scores(self, query_term: str) -> Dict[str, float]:
+        scores: Dict[str, float] = {}
+        position = bisect_left(self._terms, query_term)
+        while position < len(self._terms) and self._terms[position].startswith(query_term):
+            term = self._terms[position]
+            # Whole-word matches outrank prefix matches; longer prefixes rank closer to exact
+            factor = 1.0 if term == query_term else 0.5 * len(query_term) / len(term)
+            for product_id, weight in self._postings[term].items():
+                scores[product_id] = max(scores.get(product_id, 0.0), weight * factor)
+            position += 1
+        return scores
+    
+    def search(self, query: str, limit: int) -> List[dict]:
+        query_terms = list(dict.fromkeys(self.tokenize(query)))
+        if not query_terms:
+            return []
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload)
-            if response.status_code == 200:
-                print("Telegram notification sent successfully")
+        # Every query term has to match something (AND), scores add up across terms
+        totals: Optional[Dict[str, float]] = None
+        for query_term in query_terms:
+            scores = self._term_scores(query_term)
+            if totals is None:
+                totals = scores
             else:
-                print(f"Failed to send Telegram notification: {response.text}")
-    except Exception as e:
-        print(f"Error sending Telegram notification: {e}")
+                totals = {product_id: total + scores[product_id]
+                          for product_id, total in totals.items() if product_id in scores}
+            if not totals:
+                return []
+        
+        phrase = " ".join(query_terms)
+        for product_id in totals:
+            if self._names[product_id].startswith(phrase):
+                totals[product_id] += 2.0
+        ranked = heapq.nsmallest(limit, totals, key=lambda product_id: (-totals[product_id], self._names[product_id]))
+        return [self._products[product_id] for product_id in ranked]
+    
+    def stats(self) -> dict:
+        return {"products": len(self._products), "terms": len(self._terms)}
+
+product_search = ProductSearchIndex()
+
+# Admin order feed
+class OrderFeed:
+    # One upstream source (a change stream, or local publishes) fanned out to every dashboard
+    def __init__(self):
+        self.subscribers: set = set()
+        # Recent events, kept so a reconnecting dashboard gets only what it missed
+        self.buffer: deque = deque(maxlen=ORDER_FEED_BUFFER_SIZE)
+        self.epoch = uuid.uuid4().hex[:8]
+        self.sequence = 0
+        self.use_change_stream = False
+        self.resume_token = None
+        self.task = None
+    
+    def start(self, use_change_stream: bool):
+        self.use_change_stream = use_change_stream
+        if use_change_stream:
+            self.task = asyncio.create_task(self.watch_orders())
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+    
+    async def watch_orders(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        while True:
+            try:
+                async with collection_orders.watch(pipeline, full_document="updateLookup",
+                                                   resume_after=self.resume_token) as stream:
+                    async for change in stream:
+                        self.resume_token = change["_id"]
+                        order = change.get("fullDocument")
+                        if not order:
+                            continue
+                        order.pop("_id", None)
+                        for internal in (*ORDER_EFFECT_MARKERS, "idempotency_key"):
+                            order.pop(internal, None)
+                        event_type = "order_created" if change["operationType"] == "insert" else "order_updated"
+                        self.publish(event_type, order, event_id=self.resume_token["_data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Order change stream interrupted, resuming: {e}")
+                await asyncio.sleep(1)
+    
+    def publish_local(self, event_type: str, order: dict):
+        # With a change stream the database is the source of truth; writes show up there instead
+        if not self.use_change_stream:
+            self.publish(event_type, {key: value for key, value in order.items() if key != "_id"})
+    
+    def publish(self, event_type: str, data: dict, event_id: Optional[str] = None):
+        if event_id is None:
+            self.sequence += 1
+            event_id = f"{self.epoch}-{self.sequence}"
+        event = (event_id, event_type, render_json(data))
+        self.buffer.append(event)
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A client this far behind is dropped; it reconnects with Last-Event-ID and catches up
+                self.subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+    
+    def subscribe(self, last_event_id: Optional[str]) -> tuple:
+        queue = asyncio.Queue(maxsize=ORDER_FEED_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        if not last_event_id:
+            return queue, []
+        
+        ids = [event[0] for event in self.buffer]
+        if last_event_id in ids:
+            return queue, list(self.buffer)[ids.index(last_event_id) + 1:]
+        # Too old for the buffer, or from another process: the dashboard has to reload
+        return queue, [(f"{self.epoch}-{self.sequence}", "reset", b"{}")]
+    
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+order_feed = OrderFeed()
+
+def format_sse(event: tuple) -> bytes:
+    event_id, event_type, data = event
+    return b"id: " + event_id.encode() + b"\nevent: " + event_type.encode() + b"\ndata: " + data + b"\n\n"
+
+async def stream_order_events(request: Request, queue: asyncio.Queue, replay: List[tuple]):
+    try:
+        yield b"retry: 3000\n\n"
+        for event in replay:
+            yield format_sse(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=ORDER_FEED_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield b": keep-alive\n\n"
+                continue
+            if event is None:
+                break
+            yield format_sse(event)
+    finally:
+        order_feed.unsubscribe(queue)
+
+# Index management
+# collection name -> [(keys, options)]; create_index is a no-op when the index already exists
+INDEX_SPECS = {
+    "products": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("category_id", ASCENDING)], {}),
+    ],
+    "categories": [
+        ([("id", ASCENDING)], {"unique": True}),
+    ],
+    "orders": [
+        ([("id", ASCENDING)], {"unique": True}),
+        # Also serves plain created_at sorts through its prefix
+        ([("created_at", DESCENDING), ("id", DESCENDING)], {}),
+        ([("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+        ([("customer_phone", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+        # Only orders still waiting for their notification to be queued carry the field
+        ([("outbox_pending_since", ASCENDING)], {"sparse": True}),
+        ([("idempotency_key", ASCENDING)], {"sparse": True}),
+    ],
+    "idempotency_keys": [
+        ([("key", ASCENDING)], {"unique": True}),
+        ([("created_at", ASCENDING)], {"expireAfterSeconds": IDEMPOTENCY_TTL_SECONDS}),
+    ],
+    "admin_stream_tickets": [
+        ([("ticket", ASCENDING)], {"unique": True}),
+        ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+    "admin_revoked_tokens": [
+        ([("jti", ASCENDING)], {"unique": True}),
+        ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+    "sales_daily": [
+        ([("date", ASCENDING)], {"unique": True}),
+    ],
+    "rate_limits": [
+        ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+    "notification_outbox": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("status", ASCENDING), ("next_attempt_at", ASCENDING)], {}),
+        ([("claim_id", ASCENDING)], {}),
+    ],
+}
+
+# Queries the handlers issue: (label, collection name, filter, sort)
+QUERY_SHAPES = [
+    ("products by id", "products", {"id": "x"}, None),
+    ("products by category_id", "products", {"category_id": "x"}, None),
+    ("categories by id", "categories", {"id": "x"}, None),
+    ("orders by id", "orders", {"id": "x"}, None),
+    ("orders newest first", "orders", {}, [("created_at", -1), ("id", -1)]),
+    ("orders by status", "orders", {"status": "pending"}, [("created_at", -1), ("id", -1)]),
+    ("orders by customer_phone", "orders", {"customer_phone": "x"}, [("created_at", -1), ("id", -1)]),
+    ("orders by idempotency_key", "orders", {"idempotency_key": "x"}, None),
+    ("orders awaiting outbox", "orders", {"outbox_pending_since": {"$lte": datetime.now(timezone.utc)}}, None),
+    ("orders by created_at range", "orders",
+     {"created_at": {"$gte": "2025-01-01", "$lt": "2025-02-01"}, "status": {"$ne": "cancelled"}}, None),
+    ("sales rollups by date", "sales_daily", {"date": {"$gte": "2025-01-01", "$lte": "2025-01-31"}}, [("date", 1)]),
+    ("outbox due entries", "notification_outbox",
+     {"status": "pending", "next_attempt_at": {"$lte": datetime.now(timezone.utc)}}, [("next_attempt_at", 1)]),
+]
+
+async def ensure_indexes() -> List[dict]:
+    report = []
+    for collection_name, specs in INDEX_SPECS.items():
+        for keys, options in specs:
+            try:
+                name = await db[collection_name].create_index(keys, **options)
+                report.append({"collection": collection_name, "index": name, "ok": True})
+            except Exception as e:
+                # e.g. a unique index over existing duplicate ids; the other indexes still get built
+                print(f"Error creating index {keys} on {collection_name}: {e}")
+                report.append({"collection": collection_name, "index": str(keys), "ok": False, "error": str(e)})
+    return report
+
+def plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get("stage", "")]
+    if "inputStage" in plan:
+        stages += plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    if "queryPlan" in plan:
+        stages += plan_stages(plan["queryPlan"])
+    return stages
+
+async def check_query_plans() -> List[dict]:
+    report = []
+    for label, collection_name, filter_query, sort in QUERY_SHAPES:
+        cursor = db[collection_name].find(filter_query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        report.append({"query": label, "collection": collection_name,
+                       "collection_scan": "COLLSCAN" in stages, "stages": stages})
+    return report
+
+# Multi-worker coordination
+@asynccontextmanager
+async def mongo_lock(name: str):
+    # Lease-based lock: a second holder is only let in once the lease has expired (e.g. the owner crashed)
+    owner = uuid.uuid4().hex
+    deadline = time.monotonic() + 2 * STARTUP_LOCK_LEASE_SECONDS
+    while True:
+        now = datetime.now(timezone.utc)
+        try:
+            await collection_app_state.update_one(
+                {"_id": f"lock:{name}", "expires_at": {"$lt": now}},
+                {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=STARTUP_LOCK_LEASE_SECONDS)}},
+                upsert=True
+            )
+            break
+        except DuplicateKeyError:
+            # Held and not expired: the upsert's insert collided with the holder's document
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Timed out waiting for the {name} lock")
+            await asyncio.sleep(0.25)
+    try:
+        yield
+    finally:
+        await collection_app_state.delete_one({"_id": f"lock:{name}", "owner": owner})
+
+def index_specs_version() -> str:
+    return hashlib.sha256(repr(sorted(INDEX_SPECS.items())).encode()).hexdigest()[:16]
+
+async def bootstrap_database():
+    # Workers take turns; the first does the work and records it, the others find it done
+    async with mongo_lock("bootstrap"):
+        state = await collection_app_state.find_one({"_id": "bootstrap"}) or {}
+        changes = {}
+        
+        version = index_specs_version()
+        if state.get("index_version") != version:
+            report = await ensure_indexes()
+            if all(entry["ok"] for entry in report):
+                changes["index_version"] = version
+        
+        if CLUSTER_BROADCAST and not state.get("cluster_events"):
+            try:
+                await db.create_collection(collection_cluster_events.name, capped=True, size=CLUSTER_EVENTS_BYTES)
+            except CollectionInvalid:
+                pass
+            changes["cluster_events"] = True
+        
+        if not state.get("seeded"):
+            await seed_sample_data()
+            changes["seeded"] = True
+        
+        if not os.environ.get('ADMIN_JWT_SECRET') and not state.get("admin_jwt_secret"):
+            # Random and shared by every worker through app_state; set ADMIN_JWT_SECRET to manage the key yourself
+            changes["admin_jwt_secret"] = secrets.token_hex(32)
+        
+        if changes:
+            changes["updated_at"] = datetime.now(timezone.utc)
+            await collection_app_state.update_one({"_id": "bootstrap"}, {"$set": changes}, upsert=True)
+
+class ClusterBus:
+    # Tells the other workers about local changes (catalog writes, stock, logouts, order events)
+    # through a capped collection that every worker tails
+    def __init__(self):
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.handlers: Dict[str, Callable[[dict], Awaitable[None]]] = {}
+        self.enabled = False
+        self.task = None
+    
+    def on(self, kind: str):
+        def register(handler):
+            self.handlers[kind] = handler
+            return handler
+        return register
+    
+    def start(self):
+        self.enabled = CLUSTER_BROADCAST
+        if self.enabled:
+            self.task = asyncio.create_task(self.listen())
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+    
+    async def start_publisher(self):
+        # Command line tasks only publish; servers are listening whenever bootstrap created the capped collection
+        self.enabled = collection_cluster_events.name in await db.list_collection_names()
+    
+    async def publish(self, kind: str, payload: dict):
+        if not self.enabled:
+            return
+        try:
+            await collection_cluster_events.insert_one({"origin": self.origin, "kind": kind, "payload": payload,
+                                                        "at": datetime.now(timezone.utc)})
+        except Exception as e:
+            # Other workers catch up when their cache entries expire
+            print(f"Error broadcasting {kind}: {e}")
+    
+    async def listen(self):
+        # Only events published after this worker started matter
+        latest = await collection_cluster_events.find({}, {"_id": 1}).sort("$natural", -1).limit(1) \
+            .to_list(length=1)
+        last_id = latest[0]["_id"] if latest else None
+        while True:
+            try:
+                cursor = collection_cluster_events.find({"_id": {"$gt": last_id}} if last_id else {},
+                                                        cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for event in cursor:
+                        last_id = event["_id"]
+                        handler = self.handlers.get(event["kind"])
+                        if handler is not None and event["origin"] != self.origin:
+                            await handler(event["payload"])
+                    await asyncio.sleep(CLUSTER_POLL_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Cluster event stream interrupted, resuming: {e}")
+            # A tailable cursor on an empty capped collection dies at once; reopen it after a pause
+            await asyncio.sleep(CLUSTER_POLL_SECONDS)
+
+cluster_bus = ClusterBus()
+
+async def catalog_changed(product_ids: Optional[List[str]] = None):
+    # product_ids: products whose search entries changed; None means reindex everything
+    catalog_cache.invalidate()
+    await cluster_bus.publish("catalog", {"product_ids": product_ids})
+
+async def stock_changed(quantities: Dict[str, int], sign: int):
+    product_search.adjust_stock(quantities, sign)
+    await cluster_bus.publish("stock", {"quantities": quantities, "sign": sign})
+
+async def publish_order_event(event_type: str, order: dict):
+    order_feed.publish_local(event_type, order)
+    # With a change stream every worker already sees the write
+    if not order_feed.use_change_stream:
+        await cluster_bus.publish("order_feed", {"event_type": event_type,
+                                                 "order": {key: value for key, value in order.items() if key != "_id"}})
+
+@cluster_bus.on("catalog")
+async def on_catalog_changed(payload: dict):
+    catalog_cache.invalidate()
+    if payload["product_ids"] is None:
+        await rebuild_search_index()
+    elif payload["product_ids"]:
+        await reindex_products(payload["product_ids"])
+
+@cluster_bus.on("stock")
+async def on_stock_changed(payload: dict):
+    product_search.adjust_stock(payload["quantities"], payload["sign"])
+
+@cluster_bus.on("order_feed")
+async def on_order_event(payload: dict):
+    order_feed.publish_local(payload["event_type"], payload["order"])
+
+@cluster_bus.on("token_revoked")
+async def on_token_revoked(payload: dict):
+    admin_auth.revoke(payload["jti"], payload["exp"])
 
 # Initialize database with sample data
+def sample_id(name: str) -> str:
+    # Stable ids, so sample data written twice collides on the unique id index instead of duplicating
+    return str(uuid.uuid5(SAMPLE_DATA_NAMESPACE, name))
+
+async def seed_sample_data():
+    # Check if categories exist
+    categories_count = await collection_categories.count_documents({})
+    if categories_count == 0:
+        # Initialize categories
+        categories = [
+            {"id": sample_id("Pempek Goreng"), "name": "Pempek Goreng", "description": "Pempek yang digoreng"},
+            {"id": sample_id("Pempek Kuah"), "name": "Pempek Kuah", "description": "Pempek dengan kuah cuko"},
+            {"id": sample_id("Snack"), "name": "Snack", "description": "Cemilan pelengkap"}
+        ]
+        await collection_categories.insert_many(categories)
+        
+        # Initialize products
+        products = [
+            # Pempek Goreng
+            {"id": sample_id("Pempek Kapal Selam"), "name": "Pempek Kapal Selam", "price": 15000, 
+             "category_id": categories[0]["id"], "category_name": "Pempek Goreng",
+             "image_url": "https://images.unsplash.com/photo-1587907988134-94b4d1c3e40e", 
+             "stock": 50, "description": "Pempek isi telur yang digoreng"},
+            
+            {"id": sample_id("Pempek Lenjer"), "name": "Pempek Lenjer", "price": 8000, 
+             "category_id": categories[0]["id"], "category_name": "Pempek Goreng",
+             "image_url": "https://images.unsplash.com/photo-1540100716001-4b432820e37f", 
+             "stock": 100, "description": "Pempek bulat panjang yang digoreng"},
+            
+            {"id": sample_id("Pempek Adaan"), "name": "Pempek Adaan", "price": 5000, 
+             "category_id": categories[0]["id"], "category_name": "Pempek Goreng",
+             "image_url": "https://images.unsplash.com/photo-1642744901889-9efbec703430", 
+             "stock": 80, "description": "Pempek kecil bulat"},
+            
+            {"id": sample_id("Pempek Kulit"), "name": "Pempek Kulit", "price": 10000, 
+             "category_id": categories[0]["id"], "category_name": "Pempek Goreng",
+             "image_url": "https://images.pexels.com/photos/8858693/pexels-photo-8858693.jpeg", 
+             "stock": 30, "description": "Pempek dari kulit ikan"},
+            
+            # Pempek Kuah
+            {"id": sample_id("Tekwan"), "name": "Tekwan", "price": 12000, 
+             "category_id": categories[1]["id"], "category_name": "Pempek Kuah",
+             "image_url": "https://images.pexels.com/photos/1343537/pexels-photo-1343537.jpeg", 
+             "stock": 40, "description": "Pempek kecil dalam kuah kaldu"},
+            
+            # Snack
+            {"id": sample_id("Kemplang"), "name": "Kemplang", "price": 25000, 
+             "category_id": categories[2]["id"], "category_name": "Snack",
+             "image_url": "https://images.unsplash.com/photo-1619265554876-cbdaeb033aeb", 
+             "stock": 20, "description": "Kerupuk khas Palembang"},
+            
+            {"id": sample_id("Getas"), "name": "Getas", "price": 20000, 
+             "category_id": categories[2]["id"], "category_name": "Snack",
+             "image_url": "https://images.unsplash.com/photo-1700513971573-4f941ab7d282", 
+             "stock": 15, "description": "Cemilan renyah khas Palembang"}
+        ]
+        await collection_products.insert_many(products)
+        print("Database initialized with sample data")
+
 @app.on_event("startup")
 async def startup_event():
+    global supports_transactions, outbox_dispatcher_task, category_reconciler_task
+    
+    supports_transactions = await detect_transaction_support()
+    get_http_client()
     try:
-        # Check if categories exist
-        categories_count = await collection_categories.count_documents({})
-        if categories_count == 0:
-            # Initialize categories
-            categories = [
-                {"id": str(uuid.uuid4()), "name": "Pempek Goreng", "description": "Pempek yang digoreng"},
-                {"id": str(uuid.uuid4()), "name": "Pempek Kuah", "description": "Pempek dengan kuah cuko"},
-                {"id": str(uuid.uuid4()), "name": "Snack", "description": "Cemilan pelengkap"}
-            ]
-            await collection_categories.insert_many(categories)
-            
-            # Initialize products
-            products = [
-                # Pempek Goreng
-                {"id": str(uuid.uuid4()), "name": "Pempek Kapal Selam", "price": 15000, 
-                 "category_id": categories[0]["id"], "category_name": "Pempek Goreng",
-                 "image_url": "https://images.unsplash.com/photo-1587907988134-94b4d1c3e40e", 
-                 "stock": 50, "description": "Pempek isi telur yang digoreng"},
-                
-                {"id": str(uuid.uuid4()), "name": "Pempek Lenjer", "price": 8000, 
-                 "category_id": categories[0]["id"], "category_name": "Pempek Goreng",
-                 "image_url": "https://images.unsplash.com/photo-1540100716001-4b432820e37f", 
-                 "stock": 100, "description": "Pempek bulat panjang yang digoreng"},
-                
-                {"id": str(uuid.uuid4()), "name": "Pempek Adaan", "price": 5000, 
-                 "category_id": categories[0]["id"], "category_name": "Pempek Goreng",
-                 "image_url": "https://images.unsplash.com/photo-1642744901889-9efbec703430", 
-                 "stock": 80, "description": "Pempek kecil bulat"},
-                
-                {"id": str(uuid.uuid4()), "name": "Pempek Kulit", "price": 10000, 
-                 "category_id": categories[0]["id"], "category_name": "Pempek Goreng",
-                 "image_url": "https://images.pexels.com/photos/8858693/pexels-photo-8858693.jpeg", 
-                 "stock": 30, "description": "Pempek dari kulit ikan"},
-                
-                # Pempek Kuah
-                {"id": str(uuid.uuid4()), "name": "Tekwan", "price": 12000, 
-                 "category_id": categories[1]["id"], "category_name": "Pempek Kuah",
-                 "image_url": "https://images.pexels.com/photos/1343537/pexels-photo-1343537.jpeg", 
-                 "stock": 40, "description": "Pempek kecil dalam kuah kaldu"},
-                
-                # Snack
-                {"id": str(uuid.uuid4()), "name": "Kemplang", "price": 25000, 
-                 "category_id": categories[2]["id"], "category_name": "Snack",
-                 "image_url": "https://images.unsplash.com/photo-1619265554876-cbdaeb033aeb", 
-                 "stock": 20, "description": "Kerupuk khas Palembang"},
-                
-                {"id": str(uuid.uuid4()), "name": "Getas", "price": 20000, 
-                 "category_id": categories[2]["id"], "category_name": "Snack",
-                 "image_url": "https://images.unsplash.com/photo-1700513971573-4f941ab7d282", 
-                 "stock": 15, "description": "Cemilan renyah khas Palembang"}
-            ]
-            await collection_products.insert_many(products)
-            print("Database initialized with sample data")
+        # Indexes and sample data: done by whichever worker gets the lock first, skipped by the rest
+        await bootstrap_database()
     except Exception as e:
         print(f"Error initializing database: {e}")
+    try:
+        await admin_auth.load_secret()
+    except Exception as e:
+        print(f"Error loading the admin token signing key: {e}")
+    if not admin_auth.secret:
+        print("No admin token signing key available, admin login is disabled until ADMIN_JWT_SECRET is set")
+    try:
+        await load_revoked_tokens()
+    except Exception as e:
+        print(f"Error loading revoked admin tokens: {e}")
+    
+    order_feed.start(use_change_stream=supports_transactions)
+    if telegram_configured():
+        outbox_dispatcher_task = asyncio.create_task(run_outbox_dispatcher())
+    else:
+        print("Telegram credentials not configured, notifications will stay queued in the outbox")
+    
+    try:
+        await rebuild_search_index()
+    except Exception as e:
+        print(f"Error building product search index: {e}")
+    
+    category_reconciler_task = asyncio.create_task(run_category_reconciler())
+    cluster_bus.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await order_feed.stop()
+    await cluster_bus.stop()
+    for task in (outbox_dispatcher_task, category_reconciler_task):
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    if http_client is not None:
+        await http_client.aclose()
+    if image_executor is not None:
+        image_executor.shutdown(wait=False, cancel_futures=True)
 
 # API Routes
 
+# Projections: fetch only what the models declare, never the ObjectId _id
+def model_projection(model, fields: Optional[List[str]] = None) -> dict:
+    projection = {"_id": 0}
+    projection.update({field: 1 for field in (fields or model.model_fields)})
+    return projection
+
+CATEGORY_PROJECTION = model_projection(Category)
+PRODUCT_PROJECTION = model_projection(Product)
+ORDER_PROJECTION = model_projection(Order)
+
+def parse_product_fields(fields: Optional[str]) -> Optional[List[str]]:
+    # Sparse fieldsets, e.g. ?fields=name,price; id is always included
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in Product.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown product fields: {', '.join(unknown)}")
+    return sorted(set(requested) | {"id"})
+
+# Admin order queries
+def encode_order_cursor(order: dict) -> str:
+    raw = json.dumps([order["created_at"], order["id"]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_order_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, order_id = json.loads(raw)
+        if not isinstance(created_at, str) or not isinstance(order_id, str):
+            raise ValueError("cursor fields must be strings")
+        return created_at, order_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_date_bound(value: str, param: str, upper: bool) -> str:
+    # created_at is stored as an ISO string, so bounds are compared as ISO strings too
+    try:
+        if len(value) == 10:
+            day = datetime.fromisoformat(value)
+            return (day + timedelta(days=1) if upper else day).isoformat()
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {param}, expected ISO date or datetime")
+
+def build_order_filter(status_filter: Optional[str] = None, date_from: Optional[str] = None,
+                       date_to: Optional[str] = None, customer_phone: Optional[str] = None) -> dict:
+    filter_query = {}
+    if status_filter:
+        filter_query["status"] = status_filter
+    if customer_phone:
+        filter_query["customer_phone"] = customer_phone
+    created_at = {}
+    if date_from:
+        created_at["$gte"] = parse_date_bound(date_from, "date_from", upper=False)
+    if date_to:
+        # A bare date includes the whole day; a datetime is an exclusive upper bound
+        created_at["$lt"] = parse_date_bound(date_to, "date_to", upper=True)
+    if created_at:
+        filter_query["created_at"] = created_at
+    return filter_query
+
+def after_cursor_filter(created_at: str, order_id: str) -> dict:
+    # Keyset condition for the (created_at desc, id desc) ordering
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": order_id}},
+    ]}
+
+# Order export (oldest first, so an interrupted export resumes after the last row it got)
+ORDER_EXPORT_COLUMNS = ["id", "created_at", "status", "customer_name", "customer_phone",
+                        "customer_address", "total_amount", "items"]
+
+def after_export_filter(created_at: str, order_id: str) -> dict:
+    # Keyset condition for the (created_at asc, id asc) ordering
+    return {"$or": [
+        {"created_at": {"$gt": created_at}},
+        {"created_at": created_at, "id": {"$gt": order_id}},
+    ]}
+
+def render_ndjson_batch(orders: List[dict]) -> bytes:
+    return b"".join(render_json(order) + b"\n" for order in orders)
+
+def render_csv_batch(orders: List[dict], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(ORDER_EXPORT_COLUMNS)
+    for order in orders:
+        row = [order.get(column, "") for column in ORDER_EXPORT_COLUMNS[:-1]]
+        row.append(json.dumps(order.get("items", []), ensure_ascii=False))
+        writer.writerow(row)
+    return buffer.getvalue().encode("utf-8")
+
+async def stream_order_export(filter_query: dict, export_format: str):
+    cursor = collection_orders.find(filter_query, ORDER_PROJECTION) \
+        .sort([("created_at", 1), ("id", 1)]).batch_size(ORDER_EXPORT_BATCH_SIZE)
+    first = True
+    try:
+        while True:
+            # Only one batch is held in memory at a time, however many orders match
+            orders = await cursor.to_list(length=ORDER_EXPORT_BATCH_SIZE)
+            if not orders and not first:
+                break
+            if export_format == "csv":
+                yield render_csv_batch(orders, header=first)
+            elif orders:
+                yield render_ndjson_batch(orders)
+            first = False
+            if len(orders) < ORDER_EXPORT_BATCH_SIZE:
+                break
+    finally:
+        await cursor.close()
+
+# Stock reservation
+class InsufficientStockError(Exception):
+    def __init__(self, product_ids: List[str]):
+        super().__init__(f"Insufficient stock for {', '.join(product_ids)}")
+        self.product_ids = product_ids
+
+async def price_order_items(items: List[OrderItemRequest]) -> tuple:
+    quantities: Dict[str, int] = {}
+    for item in items:
+        quantities[item.id] = quantities.get(item.id, 0) + item.quantity
+    
+    # One $in lookup for the whole cart
+    products = await collection_products.find(
+        {"id": {"$in": list(quantities)}},
+        {"_id": 0, "id": 1, "name": 1, "price": 1}
+    ).to_list(length=len(quantities))
+    by_id = {product["id"]: product for product in products}
+    unknown = [product_id for product_id in quantities if product_id not in by_id]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown products: {', '.join(unknown)}")
+    
+    priced_items = [{
+        "id": product_id,
+        "name": by_id[product_id]["name"],
+        "price": by_id[product_id]["price"],
+        "quantity": quantity,
+        "subtotal": by_id[product_id]["price"] * quantity,
+    } for product_id, quantity in quantities.items()]
+    return priced_items, quantities
+
+async def reserve_one(product_id: str, quantity: int, session=None) -> bool:
+    # Conditional decrement: never takes stock below zero, even under concurrent checkouts
+    result = await collection_products.update_one(
+        {"id": product_id, "stock": {"$gte": quantity}},
+        {"$inc": {"stock": -quantity}},
+        session=session
+    )
+    return result.modified_count == 1
+
+async def release_stock(quantities: Dict[str, int], session=None):
+    if quantities:
+        await collection_products.bulk_write(
+            [UpdateOne({"id": product_id}, {"$inc": {"stock": quantity}})
+             for product_id, quantity in quantities.items()],
+            ordered=False, session=session
+        )
+
+async def reserve_stock(quantities: Dict[str, int], session=None):
+    if session is not None:
+        # Operations in a transaction can't run concurrently on one session; an abort undoes them all
+        failed = [product_id for product_id, quantity in quantities.items()
+                  if not await reserve_one(product_id, quantity, session=session)]
+        if failed:
+            raise InsufficientStockError(failed)
+        return
+    
+    outcomes = await asyncio.gather(
+        *[reserve_one(product_id, quantity) for product_id, quantity in quantities.items()],
+        return_exceptions=True
+    )
+    reserved = {product_id: quantity for (product_id, quantity), outcome
+                in zip(quantities.items(), outcomes) if outcome is True}
+    if len(reserved) == len(quantities):
+        return
+    
+    # Roll back the items that did get reserved before reporting the failure
+    await release_stock(reserved)
+    errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+    if errors:
+        raise errors[0]
+    raise InsufficientStockError([product_id for product_id in quantities if product_id not in reserved])
+
+# Idempotency keys
+def request_fingerprint(model: BaseModel) -> str:
+    return hashlib.sha256(render_json(model.dict())).hexdigest()
+
+async def claim_idempotency_key(key: str, fingerprint: str, claim_id: str) -> Optional[Response]:
+    # The unique index on key decides the winner; concurrent duplicates get DuplicateKeyError
+    now = datetime.now(timezone.utc)
+    try:
+        await collection_idempotency_keys.insert_one({
+            "key": key,
+            "fingerprint": fingerprint,
+            "status": "in_progress",
+            "claim_id": claim_id,
+            "lease_until": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+            "created_at": now,
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+    
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        existing = await collection_idempotency_keys.find_one({"key": key}, {"_id": 0})
+        if existing is None:
+            # The first attempt failed and released the key; this request may proceed
+            return await claim_idempotency_key(key, fingerprint, claim_id)
+        if existing["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        if existing["status"] == "completed":
+            return JSONResponse(existing["response"], status_code=existing["status_code"],
+                                headers={"Idempotent-Replayed": "true"})
+        lease_until = existing.get("lease_until")
+        now = datetime.now(timezone.utc)
+        if lease_until is not None and lease_until.replace(tzinfo=timezone.utc) <= now:
+            # The order may have been placed with only the completion write lost; replay it rather than order twice
+            placed = await collection_orders.find_one({"idempotency_key": key}, {"_id": 0, "id": 1, "total_amount": 1})
+            if placed is not None:
+                response = order_placed_response(placed["id"], placed["total_amount"])
+                await collection_idempotency_keys.update_one(
+                    {"key": key, "status": "in_progress"},
+                    {"$set": {"status": "completed", "response": response, "status_code": 200}}
+                )
+                return JSONResponse(response, headers={"Idempotent-Replayed": "true"})
+            # The claimer crashed before completing or releasing; without this the key would block retries until the TTL
+            taken = await collection_idempotency_keys.update_one(
+                {"key": key, "status": "in_progress", "claim_id": existing.get("claim_id")},
+                {"$set": {"claim_id": claim_id, "lease_until": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}}
+            )
+            if taken.modified_count:
+                return None
+            continue
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        await asyncio.sleep(0.1)
+
+async def complete_idempotency_key(key: str, claim_id: str, response: dict, status_code: int = 200):
+    # Scoped to the claim, so an attempt whose lease was taken over can't overwrite the new owner's entry
+    await collection_idempotency_keys.update_one(
+        {"key": key, "claim_id": claim_id},
+        {"$set": {"status": "completed", "response": response, "status_code": status_code}}
+    )
+
+async def release_idempotency_key(key: str, claim_id: str):
+    # Failed attempts are not replayed, so the client can retry with the same key
+    await collection_idempotency_keys.delete_one({"key": key, "status": "in_progress", "claim_id": claim_id})
+
+# Order status workflow
+ORDER_TRANSITIONS = {
+    "pending": {"confirmed", "cancelled"},
+    "confirmed": {"cooking", "cancelled"},
+    "cooking": {"delivered", "cancelled"},
+    "delivered": set(),
+    "cancelled": set(),
+}
+
+ORDER_STATUS_LABELS = {
+    "pending": "⏳ Menunggu Konfirmasi",
+    "confirmed": "✅ Dikonfirmasi",
+    "cooking": "👨‍🍳 Sedang Dimasak",
+    "delivered": "🛵 Terkirim",
+    "cancelled": "❌ Dibatalkan",
+}
+
+def statuses_leading_to(target: str) -> List[str]:
+    return [current for current, targets in ORDER_TRANSITIONS.items() if target in targets]
+
+# Set on orders placed with a stock reservation and counted in the rollups. Orders from before either
+# feature still carry item ids and quantities, so cancelling them must not give anything back.
+ORDER_EFFECT_MARKERS = {"stock_reserved": True, "in_rollups": True}
+
+async def reverse_order_effects(orders: List[dict]):
+    released = order_item_quantities([order for order in orders if order.get("stock_reserved")])
+    if released:
+        await release_stock(released)
+        await stock_changed(released, 1)
+    await apply_rollups([order for order in orders if order.get("in_rollups")], sign=-1)
+
+def order_item_quantities(orders: List[dict]) -> Dict[str, int]:
+    quantities: Dict[str, int] = {}
+    for order in orders:
+        for item in order.get("items", []):
+            if "id" in item and "quantity" in item:
+                quantities[item["id"]] = quantities.get(item["id"], 0) + item["quantity"]
+    return quantities
+
+# Telegram rejects messages over 4096 characters; 20 lines of at most ~115 stay well below it
+STATUS_MESSAGE_MAX_LINES = 20
+
+def format_status_message(orders: List[dict], target: str) -> str:
+    lines = "\n".join([f"• {order['id'][:8]} - {order['customer_name']}"
+                       for order in orders[:STATUS_MESSAGE_MAX_LINES]])
+    if len(orders) > STATUS_MESSAGE_MAX_LINES:
+        lines += f"\n… dan {len(orders) - STATUS_MESSAGE_MAX_LINES} lainnya"
+    return f"""🔄 *UPDATE STATUS PESANAN* 🔄
+
+{len(orders)} pesanan → {ORDER_STATUS_LABELS[target]}
+
+{lines}"""
+
+async def enqueue_notification(kind: str, ref_id: str, text: str):
+    await collection_outbox.insert_one(new_outbox_entry(kind, ref_id, text))
+    outbox_wakeup.set()
+
+# Bulk product import
+async def read_product_rows(request: Request) -> List[Any]:
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Expected a CSV file in the 'file' field")
+        text = (await upload.read()).decode("utf-8-sig")
+        # Empty CSV cells leave the field alone (stored value, or the model default for new products)
+        return [{key: value for key, value in row.items() if key and value not in (None, "")}
+                for row in csv.DictReader(io.StringIO(text))]
+    
+    try:
+        rows = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Expected a JSON array of products or a CSV upload")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of products")
+    return rows
+
+def product_upsert(product: Product) -> dict:
+    # Only the fields a row provides overwrite an existing product; defaults apply to new ones only
+    provided = product.dict(exclude_unset=True)
+    provided.pop("id", None)
+    defaults = {field: value for field, value in product.dict().items()
+                if field != "id" and field not in provided}
+    update = {"$set": provided} if provided else {}
+    if defaults:
+        update["$setOnInsert"] = defaults
+    return update
+
+def validate_product_rows(rows: List[Any]) -> tuple:
+    products, report = [], []
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            report.append({"row": index, "ok": False, "errors": ["Row must be an object"]})
+            continue
+        try:
+            product = Product(**row)
+        except ValidationError as e:
+            errors = [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()]
+            report.append({"row": index, "id": row.get("id"), "ok": False, "errors": errors})
+            continue
+        products.append((index, product))
+        report.append({"row": index, "id": product.id, "ok": True})
+    return products, report
+
+# Sales analytics
+# One sales_daily document per day, updated with $inc as orders are placed or cancelled,
+# so dashboards read O(days) documents instead of scanning orders.
+def rollup_increments(order: dict, sign: int = 1) -> dict:
+    hour = order["created_at"][11:13]
+    increments = {
+        "orders": sign,
+        "revenue": sign * order["total_amount"],
+        f"hours.{hour}.orders": sign,
+        f"hours.{hour}.revenue": sign * order["total_amount"],
+    }
+    for item in order.get("items", []):
+        if "id" not in item:
+            continue
+        increments["items_sold"] = increments.get("items_sold", 0) + sign * item["quantity"]
+        increments[f"products.{item['id']}.quantity"] = \
+            increments.get(f"products.{item['id']}.quantity", 0) + sign * item["quantity"]
+        increments[f"products.{item['id']}.revenue"] = \
+            increments.get(f"products.{item['id']}.revenue", 0) + sign * item["subtotal"]
+    return increments
+
+async def apply_rollups(orders: List[dict], sign: int = 1):
+    operations = []
+    for order in orders:
+        names = {f"products.{item['id']}.name": item["name"] for item in order.get("items", []) if "id" in item}
+        operations.append(UpdateOne({"date": order["created_at"][:10]},
+                                    {"$inc": rollup_increments(order, sign), "$set": names}, upsert=True))
+    if not operations:
+        return
+    try:
+        await collection_sales_daily.bulk_write(operations, ordered=False)
+    except Exception as e:
+        # Best effort: a missed update is repaired by 'python server.py backfill-rollups'
+        print(f"Error updating sales rollups: {e}")
+
+def analytics_date_range(date_from: Optional[str], date_to: Optional[str]) -> tuple:
+    try:
+        end = datetime.fromisoformat(date_to).date() if date_to else datetime.now().date()
+        start = datetime.fromisoformat(date_from).date() if date_from else end - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+    if start > end:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    return start.isoformat(), end.isoformat()
+
+async def aggregate_rollups(start: str, end: str) -> List[dict]:
+    # Rebuilds rollup documents from the orders themselves, using the created_at index
+    day_after_end = (datetime.fromisoformat(end) + timedelta(days=1)).date().isoformat()
+    match = {"$match": {"created_at": {"$gte": start, "$lt": day_after_end}, "status": {"$ne": "cancelled"}}}
+    day = {"$substrCP": ["$created_at", 0, 10]}
+    totals = await collection_orders.aggregate([
+        match,
+        {"$group": {"_id": day, "orders": {"$sum": 1}, "revenue": {"$sum": "$total_amount"}}},
+    ]).to_list(length=None)
+    hours = await collection_orders.aggregate([
+        match,
+        {"$group": {"_id": {"date": day, "hour": {"$substrCP": ["$created_at", 11, 2]}},
+                    "orders": {"$sum": 1}, "revenue": {"$sum": "$total_amount"}}},
+    ]).to_list(length=None)
+    products = await collection_orders.aggregate([
+        match,
+        {"$unwind": "$items"},
+        {"$match": {"items.id": {"$exists": True}}},
+        {"$group": {"_id": {"date": day, "product": "$items.id"}, "name": {"$last": "$items.name"},
+                    "quantity": {"$sum": "$items.quantity"}, "revenue": {"$sum": "$items.subtotal"}}},
+    ]).to_list(length=None)
+    
+    rollups = {row["_id"]: {"date": row["_id"], "orders": row["orders"], "revenue": row["revenue"],
+                            "items_sold": 0, "hours": {}, "products": {}} for row in totals}
+    for row in hours:
+        rollups[row["_id"]["date"]]["hours"][row["_id"]["hour"]] = {"orders": row["orders"], "revenue": row["revenue"]}
+    for row in products:
+        rollup = rollups[row["_id"]["date"]]
+        rollup["products"][row["_id"]["product"]] = {"name": row["name"], "quantity": row["quantity"],
+                                                     "revenue": row["revenue"]}
+        rollup["items_sold"] += row["quantity"]
+    return [rollups[date] for date in sorted(rollups)]
+
+async def load_rollups(start: str, end: str, source: str, projection: Optional[dict] = None) -> List[dict]:
+    if source == "orders":
+        return await aggregate_rollups(start, end)
+    return await collection_sales_daily.find(
+        {"date": {"$gte": start, "$lte": end}}, projection or {"_id": 0}
+    ).sort("date", 1).to_list(length=None)
+
+async def backfill_rollups(date_from: Optional[str] = None, date_to: Optional[str] = None) -> int:
+    # Stops at yesterday by default: today's orders keep updating its rollup while the rebuild runs,
+    # so an explicit --date-to of today is only safe with order writes paused
+    yesterday = (datetime.now().date() - timedelta(days=1)).isoformat()
+    if date_from or date_to:
+        start, end = analytics_date_range(date_from, date_to or yesterday)
+    else:
+        first = await collection_orders.find({}, {"_id": 0, "created_at": 1}).sort("created_at", 1).limit(1).to_list(1)
+        start, end = (first[0]["created_at"][:10] if first else yesterday), yesterday
+        if start > end:
+            return 0
+    rollups = await aggregate_rollups(start, end)
+    # Rebuilt days count every order in them, so cancelling any of those orders must subtract it again
+    day_after_end = (datetime.fromisoformat(end) + timedelta(days=1)).date().isoformat()
+    await collection_orders.update_many(
+        {"created_at": {"$gte": start, "$lt": day_after_end}, "status": {"$ne": "cancelled"}},
+        {"$set": {"in_rollups": True}}
+    )
+    # Replaced day by day, so a concurrent $inc upsert never collides with the unique date index
+    if rollups:
+        await collection_sales_daily.bulk_write(
+            [ReplaceOne({"date": rollup["date"]}, rollup, upsert=True) for rollup in rollups], ordered=False
+        )
+    # Days left with no orders (e.g. all cancelled) have nothing to replace them
+    await collection_sales_daily.delete_many(
+        {"date": {"$gte": start, "$lte": end, "$nin": [rollup["date"] for rollup in rollups]}}
+    )
+    return len(rollups)
+
+# Product images
+image_executor: Optional[ProcessPoolExecutor] = None
+MEDIA_NAME_PATTERN = re.compile(r"^[0-9a-f]{16}-[0-9]+\.(webp|jpg)$")
+IMAGE_FORMATS = (("webp", "WEBP", "webp"), ("jpeg", "JPEG", "jpg"))
+
+def render_image_variants(data: bytes, widths: tuple) -> List[tuple]:
+    # Runs in a worker process: decoding and resizing are CPU bound and would stall the event loop
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source).convert("RGB")
+    variants = []
+    # Never upscale; small originals just get their own size
+    targets = sorted({min(width, image.width) for width in widths})
+    for width in targets:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+        for key, pil_format, extension in IMAGE_FORMATS:
+            buffer = io.BytesIO()
+            options = {"quality": 80, "method": 4} if pil_format == "WEBP" else \
+                {"quality": 82, "optimize": True, "progressive": True}
+            resized.save(buffer, pil_format, **options)
+            variants.append((key, width, extension, buffer.getvalue()))
+    return variants
+
+def get_image_executor() -> ProcessPoolExecutor:
+    global image_executor
+    if image_executor is None:
+        image_executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return image_executor
+
+def write_media_files(files: List[tuple]):
+    MEDIA_ROOT.mkdir(parents=True, exist_ok=True)
+    for name, content in files:
+        path = MEDIA_ROOT / name
+        if not path.exists():
+            temporary = path.with_suffix(path.suffix + ".tmp")
+            temporary.write_bytes(content)
+            temporary.replace(path)
+
+async def store_image_variants(data: bytes) -> Dict[str, str]:
+    if Image is None:
+        raise HTTPException(status_code=503, detail="Image processing is unavailable (Pillow is not installed)")
+    
+    # Content-addressed: the same upload maps to the same names, so the files can be cached forever
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    loop = asyncio.get_running_loop()
+    try:
+        variants = await loop.run_in_executor(
+            get_image_executor(), render_image_variants, data, IMAGE_VARIANT_WIDTHS
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not process image: {e}")
+    
+    files = [(f"{digest}-{width}.{extension}", content) for _, width, extension, content in variants]
+    await asyncio.to_thread(write_media_files, files)
+    return {f"{key}_{width}": f"{MEDIA_URL_PREFIX}/{digest}-{width}.{extension}"
+            for key, width, extension, _ in variants}
+
+def primary_image_url(variants: Dict[str, str]) -> str:
+    jpeg_widths = [int(key.split("_")[1]) for key in variants if key.startswith("jpeg_")]
+    return variants[f"jpeg_{max(jpeg_widths)}"]
+
+async def regenerate_product_images(force: bool = False, concurrency: int = 4) -> dict:
+    # Batch job: download each product's original image and replace it with local variants
+    query = {} if force else {"image_variants": {"$in": [None, {}]}}
+    products = await collection_products.find(query, {"_id": 0, "id": 1, "name": 1, "image_url": 1}) \
+        .to_list(length=None)
+    semaphore = asyncio.Semaphore(concurrency)
+    report = {"processed": 0, "failed": 0}
+    
+    async def regenerate(product: dict):
+        async with semaphore:
+            try:
+                source_url = product.get("image_url") or ""
+                if source_url.startswith(MEDIA_URL_PREFIX):
+                    data = (MEDIA_ROOT / source_url.rsplit("/", 1)[1]).read_bytes()
+                else:
+                    response = await get_http_client().get(source_url, follow_redirects=True)
+                    response.raise_for_status()
+                    data = response.content
+                variants = await store_image_variants(data)
+                await collection_products.update_one(
+                    {"id": product["id"]},
+                    {"$set": {"image_variants": variants, "image_url": primary_image_url(variants)}}
+                )
+                report["processed"] += 1
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else e
+                print(f"Error regenerating image for {product['name']}: {detail}")
+                report["failed"] += 1
+    
+    await asyncio.gather(*[regenerate(product) for product in products])
+    if report["processed"]:
+        await catalog_changed([product["id"] for product in products])
+        await reindex_products([product["id"] for product in products])
+    return report
+
+async def rebuild_search_index():
+    products = await collection_products.find({}, PRODUCT_PROJECTION).to_list(length=None)
+    product_search.rebuild(products)
+    print(f"Product search index built: {len(products)} products")
+
+async def reindex_products(product_ids: List[str]):
+    # For writes that only $set a few fields: reload the documents and replace their entries
+    products = await collection_products.find({"id": {"$in": product_ids}}, PRODUCT_PROJECTION) \
+        .to_list(length=len(product_ids))
+    for product_id in product_ids:
+        product_search.remove(product_id)
+    for product in products:
+        product_search.upsert(product)
+
+# Category consistency
+# Products carry a copy of their category's name; these keep the copies in line with the categories
+async def propagate_category_name(category_id: str, name: str) -> int:
+    result = await collection_products.update_many(
+        {"category_id": category_id, "category_name": {"$ne": name}},
+        {"$set": {"category_name": name}}
+    )
+    return result.modified_count
+
+async def reconcile_category_names() -> dict:
+    categories = await collection_categories.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(length=None)
+    report = {"categories": len(categories), "fixed": 0, "orphaned": 0}
+    if categories:
+        # One round trip for every category: only drifted products match, so clean data costs no writes
+        result = await collection_products.bulk_write([
+            UpdateMany({"category_id": category["id"], "category_name": {"$ne": category["name"]}},
+                       {"$set": {"category_name": category["name"]}})
+            for category in categories
+        ], ordered=False)
+        report["fixed"] = result.modified_count
+    # Products pointing at a category that no longer exists can't be repaired automatically
+    report["orphaned"] = await collection_products.count_documents(
+        {"category_id": {"$nin": [category["id"] for category in categories]}}
+    )
+    if report["fixed"]:
+        await catalog_changed()
+        await rebuild_search_index()
+    return report
+
+async def run_category_reconciler():
+    while True:
+        await asyncio.sleep(CATEGORY_RECONCILE_INTERVAL_SECONDS)
+        try:
+            report = await reconcile_category_names()
+            if report["fixed"] or report["orphaned"]:
+                print(f"Category reconciliation: fixed {report['fixed']} product(s), "
+                      f"{report['orphaned']} orphaned")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error reconciling category names: {e}")
+
+# Catalog loaders (cached by the public routes)
+# Documents are written by our own models, so the projected dicts are served as-is
+async def load_categories() -> CachedPayload:
+    categories = await collection_catalog_categories.find({}, CATEGORY_PROJECTION).to_list(length=None)
+    return CachedPayload(categories)
+
+async def load_category_ids() -> Dict[str, str]:
+    categories = await collection_catalog_categories.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(length=None)
+    category_ids = {}
+    for category in categories:
+        category_ids.setdefault(category["name"], category["id"])
+    return category_ids
+
+async def load_product_category_ids() -> set:
+    return set(await collection_catalog_products.distinct("category_id"))
+
+async def load_products(category_id: Optional[str] = None, fields: Optional[List[str]] = None) -> CachedPayload:
+    filter_query = {}
+    if category_id:
+        filter_query["category_id"] = category_id
+    
+    projection = model_projection(Product, fields) if fields else PRODUCT_PROJECTION
+    products = await collection_catalog_products.find(filter_query, projection).to_list(length=None)
+    return CachedPayload(products)
+
+async def load_storefront() -> CachedPayload:
+    # Everything the storefront's first paint needs, grouped so the client filters without refetching
+    categories, products = await asyncio.gather(
+        collection_catalog_categories.find({}, CATEGORY_PROJECTION).to_list(length=None),
+        collection_catalog_products.find({}, PRODUCT_PROJECTION).to_list(length=None),
+    )
+    grouped = {category["id"]: [] for category in categories}
+    for product in products:
+        grouped.setdefault(product["category_id"], []).append(product)
+    return CachedPayload({"categories": categories, "products": grouped})
+
+EMPTY_PAYLOAD = CachedPayload([])
+
 # Public routes
 @app.get("/api/categories")
-async def get_categories() -> List[Category]:
+async def get_categories(request: Request) -> List[Category]:
     try:
-        categories = await collection_categories.find().to_list(length=None)
-        return [Category(**cat) for cat in categories]
+        payload = await catalog_cache.get_or_load(("categories",), load_categories)
+        return cached_json_response(request, payload)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching categories: {str(e)}")
 
+@app.get("/api/storefront")
+async def get_storefront(request: Request):
+    try:
+        payload = await catalog_cache.get_or_load(("storefront",), load_storefront)
+        return cached_json_response(request, payload)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching storefront: {str(e)}")
+
 @app.get("/api/products")
-async def get_products(category: Optional[str] = None) -> List[Product]:
+async def get_products(request: Request, category_id: Optional[str] = None, category: Optional[str] = None,
+                       fields: Optional[str] = None) -> List[Product]:
     try:
-        filter_query = {}
-        if category:
-            filter_query["category_name"] = category
-        
-        products = await collection_products.find(filter_query).to_list(length=None)
-        return [Product(**product) for product in products]
+        selected = parse_product_fields(fields)
+        if category and not category_id:
+            # Filtering by name is still accepted; it resolves to the id through a cached map
+            category_ids = await catalog_cache.get_or_load(("category_ids",), load_category_ids)
+            if category not in category_ids:
+                return cached_json_response(request, EMPTY_PAYLOAD)
+            category_id = category_ids[category]
+        if category_id:
+            # Only ids some product carries can match, so arbitrary ids can't each add a cache entry
+            known_ids = await catalog_cache.get_or_load(("product_category_ids",), load_product_category_ids)
+            if category_id not in known_ids:
+                return cached_json_response(request, EMPTY_PAYLOAD)
+        key = ("products", category_id or None, tuple(selected) if selected else None)
+        payload = await catalog_cache.get_or_load(key, lambda: load_products(category_id, selected))
+        return cached_json_response(request, payload)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching products: {str(e)}")
 
+@app.get("/api/products/search")
+async def search_products(q: str = Query(..., max_length=100),
+                          limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT)) -> List[Product]:
+    try:
+        with stage_duration.time("search_products"):
+            results = product_search.search(q, limit)
+        return json_response(results)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching products: {str(e)}")
+
 @app.post("/api/orders")
-async def create_order(order: Order):
+async def create_order(order_request: OrderRequest,
+                       idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)):
+    claim_id = str(uuid.uuid4())
+    if idempotency_key:
+        replay = await claim_idempotency_key(idempotency_key, request_fingerprint(order_request), claim_id)
+        if replay is not None:
+            return replay
+    
+    try:
+        response = await place_order(order_request, idempotency_key)
+    except BaseException:
+        if idempotency_key:
+            await release_idempotency_key(idempotency_key, claim_id)
+        raise
+    
+    if idempotency_key:
+        try:
+            await complete_idempotency_key(idempotency_key, claim_id, response)
+        except Exception as e:
+            # The order is placed; a retry that takes over the lease finds it through its idempotency_key
+            print(f"Error completing Idempotency-Key for order {response['order_id']}: {e}")
+    return response
+
+def order_placed_response(order_id: str, total_amount: int) -> dict:
+    return {"message": "Pesanan berhasil dikirim!", "order_id": order_id, "total_amount": total_amount}
+
+async def place_order(order_request: OrderRequest, idempotency_key: Optional[str] = None) -> dict:
     try:
-        order_dict = order.dict()
-        await collection_orders.insert_one(order_dict)
+        items, quantities = await price_order_items(order_request.items)
+        with stage_duration.time("build_order"):
+            order = Order(
+                customer_name=order_request.customer_name,
+                customer_phone=order_request.customer_phone,
+                customer_address=order_request.customer_address,
+                items=items,
+                total_amount=sum(item["subtotal"] for item in items),
+            )
+            order_dict = order.dict()
+            # Stored only: cancelling gives stock and rollups back just for orders that took them
+            stored_order = {**order_dict, **ORDER_EFFECT_MARKERS}
+            if idempotency_key:
+                stored_order["idempotency_key"] = idempotency_key
+        outbox_entry = new_outbox_entry("new_order", order.id, format_order_message(order))
         
-        # Send Telegram notification
-        await send_telegram_notification(order)
+        # Stock, the order and its notification are persisted together; the dispatcher sends it later
+        if supports_transactions:
+            async def write_order(session):
+                await reserve_stock(quantities, session=session)
+                await collection_orders.insert_one(stored_order, session=session)
+                await collection_outbox.insert_one(outbox_entry, session=session)
+            
+            async with await client.start_session() as session:
+                # Concurrent checkouts of the same product conflict inside transactions; with_transaction
+                # retries on TransientTransactionError and UnknownTransactionCommitResult, while a real
+                # stock shortage aborts and surfaces as InsufficientStockError.
+                # Inside a transaction the write concern is the transaction's, not the collection's.
+                await session.with_transaction(write_order, write_concern=ORDER_WRITE_CONCERN)
+        else:
+            await reserve_stock(quantities)
+            # Marked until its notification is queued, so the outbox sweeper can recover one lost in between
+            try:
+                await collection_orders.insert_one({**stored_order, "outbox_pending_since": datetime.now(timezone.utc)})
+            except Exception:
+                await release_stock(quantities)
+                raise
+            try:
+                await collection_outbox.insert_one(outbox_entry)
+                await collection_orders.update_one({"id": order.id}, {"$unset": {"outbox_pending_since": ""}})
+            except Exception as e:
+                # The order and its stock are already committed, so the checkout itself succeeded
+                print(f"Error queueing notification for order {order.id}, the outbox sweeper will retry: {e}")
+        outbox_wakeup.set()
+        await publish_order_event("order_created", order_dict)
+        await stock_changed(quantities, -1)
+        await apply_rollups([order_dict])
         
-        return {"message": "Pesanan berhasil dikirim!", "order_id": order.id}
+        return order_placed_response(order.id, order.total_amount)
+    except InsufficientStockError as e:
+        names = [item["name"] for item in items if item["id"] in e.product_ids]
+        raise HTTPException(status_code=409, detail={"message": "Insufficient stock", "items": names})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating order: {str(e)}")
 
 # Admin routes
 @app.post("/api/admin/login")
 async def admin_login(login_request: LoginRequest):
-    admin_username = os.environ.get('ADMIN_USERNAME')
-    admin_password = os.environ.get('ADMIN_PASSWORD')
-    
-    if login_request.username != admin_username or login_request.password != admin_password:
+    if not admin_auth.check_credentials(login_request.username, login_request.password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if not admin_auth.secret:
+        raise HTTPException(status_code=503, detail="Admin login is not configured")
     
-    # Simple token (in real app, use JWT)
-    token = f"{admin_username}:{admin_password}"
-    return {"access_token": token, "token_type": "bearer"}
+    token, expires_at = admin_auth.issue_token()
+    return {"access_token": token, "token_type": "bearer", "expires_in": expires_at - int(time.time())}
+
+@app.post("/api/admin/logout")
+async def admin_logout(credentials: HTTPAuthorizationCredentials = Depends(security),
+                       admin_verified: bool = Depends(verify_admin)):
+    try:
+        claims = admin_auth.decode(credentials.credentials)
+        expires_at = datetime.fromtimestamp(claims["exp"], tz=timezone.utc)
+        admin_auth.revoke(claims["jti"], claims["exp"])
+        await cluster_bus.publish("token_revoked", {"jti": claims["jti"], "exp": claims["exp"]})
+        # Persisted so the revocation survives restarts; the TTL index drops it once the token expires
+        await collection_revoked_tokens.update_one(
+            {"jti": claims["jti"]},
+            {"$set": {"jti": claims["jti"], "expires_at": expires_at}},
+            upsert=True
+        )
+        return {"message": "Logged out successfully"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error logging out: {str(e)}")
 
 @app.get("/api/admin/orders")
-async def get_admin_orders(admin_verified: bool = Depends(verify_admin)) -> List[Order]:
+async def get_admin_orders(
+    limit: int = Query(ADMIN_ORDERS_DEFAULT_LIMIT, ge=1, le=ADMIN_ORDERS_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    customer_phone: Optional[str] = None,
+    unpaginated: bool = Query(False, alias="all"),
+    admin_verified: bool = Depends(verify_admin)
+):
     try:
-        orders = await collection_orders.find().sort("created_at", -1).to_list(length=None)
-        return [Order(**order) for order in orders]
+        filter_query = build_order_filter(status_filter, date_from, date_to, customer_phone)
+        sort = [("created_at", -1), ("id", -1)]
+        
+        # Legacy behaviour: every matching order in one response, only on explicit request
+        if unpaginated:
+            orders = await collection_orders.find(filter_query, ORDER_PROJECTION).sort(sort).to_list(length=None)
+            return json_response(orders)
+        
+        if cursor:
+            filter_query = {"$and": [filter_query, after_cursor_filter(*decode_order_cursor(cursor))]}
+        orders = await collection_orders.find(filter_query, ORDER_PROJECTION) \
+            .sort(sort).limit(limit + 1).to_list(length=limit + 1)
+        next_cursor = encode_order_cursor(orders[limit - 1]) if len(orders) > limit else None
+        return json_response({"orders": orders[:limit], "next_cursor": next_cursor})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching orders: {str(e)}")
 
+@app.get("/api/admin/orders/export")
+async def export_admin_orders(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    customer_phone: Optional[str] = None,
+    after_id: Optional[str] = None,
+    admin_verified: bool = Depends(verify_admin)
+):
+    try:
+        filter_query = build_order_filter(status_filter, date_from, date_to, customer_phone)
+        if after_id:
+            last_seen = await collection_orders.find_one({"id": after_id}, {"_id": 0, "created_at": 1, "id": 1})
+            if not last_seen:
+                raise HTTPException(status_code=400, detail="after_id does not match any order")
+            filter_query = {"$and": [filter_query, after_export_filter(last_seen["created_at"], last_seen["id"])]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error exporting orders: {str(e)}")
+    
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    filename = f"orders-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return StreamingResponse(
+        stream_order_export(filter_query, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/api/admin/orders/stream-ticket")
+async def create_stream_ticket(admin_verified: bool = Depends(verify_admin)):
+    try:
+        ticket = secrets.token_urlsafe(32)
+        await collection_stream_tickets.insert_one({
+            "ticket": ticket,
+            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=STREAM_TICKET_TTL_SECONDS),
+        })
+        return {"ticket": ticket, "expires_in": STREAM_TICKET_TTL_SECONDS}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating stream ticket: {str(e)}")
+
+@app.get("/api/admin/orders/stream")
+async def stream_admin_orders(request: Request, last_event_id: Optional[str] = None,
+                              admin_verified: bool = Depends(verify_admin_stream)):
+    # A reconnect with a fresh ticket is a new EventSource, which passes its position in the query string
+    queue, replay = order_feed.subscribe(request.headers.get("last-event-id") or last_event_id)
+    return StreamingResponse(
+        stream_order_events(request, queue, replay),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.patch("/api/admin/orders/{order_id}")
+async def update_order_status(order_id: str, update: OrderStatusUpdate,
+                              admin_verified: bool = Depends(verify_admin)):
+    try:
+        # The status condition makes the transition atomic against concurrent updates
+        updated = await collection_orders.find_one_and_update(
+            {"id": order_id, "status": {"$in": statuses_leading_to(update.status)}},
+            {"$set": {"status": update.status, "updated_at": datetime.now().isoformat()}},
+            projection={**ORDER_PROJECTION, **{marker: 1 for marker in ORDER_EFFECT_MARKERS}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not updated:
+            existing = await collection_orders.find_one({"id": order_id}, {"_id": 0, "status": 1})
+            if not existing:
+                raise HTTPException(status_code=404, detail="Order not found")
+            raise HTTPException(status_code=409,
+                                detail=f"Cannot change status from {existing['status']} to {update.status}")
+        
+        markers = {marker: updated.pop(marker, False) for marker in ORDER_EFFECT_MARKERS}
+        if update.status == "cancelled":
+            await reverse_order_effects([{**updated, **markers}])
+        await publish_order_event("order_updated", updated)
+        await enqueue_notification("status_change", order_id, format_status_message([updated], update.status))
+        return updated
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating order: {str(e)}")
+
+@app.post("/api/admin/orders/bulk-status")
+async def bulk_update_order_status(update: BulkOrderStatusUpdate, admin_verified: bool = Depends(verify_admin)):
+    try:
+        order_ids = list(dict.fromkeys(update.order_ids))
+        existing = await collection_orders.find(
+            {"id": {"$in": order_ids}},
+            {"_id": 0, "id": 1, "status": 1, "customer_name": 1, "items": 1, "created_at": 1, "total_amount": 1,
+             **{marker: 1 for marker in ORDER_EFFECT_MARKERS}}
+        ).to_list(length=len(order_ids))
+        by_id = {order["id"]: order for order in existing}
+        
+        results = {}
+        candidates = []
+        for order_id in order_ids:
+            order = by_id.get(order_id)
+            if order is None:
+                results[order_id] = {"id": order_id, "ok": False, "error": "Order not found"}
+            elif update.status not in ORDER_TRANSITIONS[order["status"]]:
+                results[order_id] = {"id": order_id, "ok": False,
+                                     "error": f"Cannot change status from {order['status']} to {update.status}"}
+            else:
+                candidates.append(order)
+        
+        applied = []
+        if candidates:
+            updated_at = datetime.now().isoformat()
+            # Each update is conditional on the status we just read, so a concurrent change wins cleanly
+            result = await collection_orders.bulk_write([
+                UpdateOne({"id": order["id"], "status": order["status"]},
+                          {"$set": {"status": update.status, "updated_at": updated_at}})
+                for order in candidates
+            ], ordered=False)
+            applied = candidates
+            if result.modified_count < len(candidates):
+                current = await collection_orders.find(
+                    {"id": {"$in": [order["id"] for order in candidates]}},
+                    {"_id": 0, "id": 1, "status": 1, "updated_at": 1}
+                ).to_list(length=len(candidates))
+                ours = {order["id"] for order in current
+                        if order["status"] == update.status and order.get("updated_at") == updated_at}
+                applied = [order for order in candidates if order["id"] in ours]
+            for order in candidates:
+                results[order["id"]] = {"id": order["id"], "ok": True} if order in applied else \
+                    {"id": order["id"], "ok": False, "error": "Order was modified concurrently"}
+        
+        if applied:
+            if update.status == "cancelled":
+                await reverse_order_effects(applied)
+            if not order_feed.use_change_stream:
+                updated_orders = await collection_orders.find(
+                    {"id": {"$in": [order["id"] for order in applied]}}, ORDER_PROJECTION
+                ).to_list(length=len(applied))
+                for order in updated_orders:
+                    await publish_order_event("order_updated", order)
+            # One consolidated message for the whole batch instead of one per order
+            await enqueue_notification("bulk_status_change", applied[0]["id"],
+                                       format_status_message(applied, update.status))
+        
+        return {
+            "status": update.status,
+            "updated": len(applied),
+            "results": [results[order_id] for order_id in order_ids],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating orders: {str(e)}")
+
+@app.get("/api/admin/analytics/daily")
+async def get_daily_analytics(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                              source: str = Query("rollups", pattern="^(rollups|orders)$"),
+                              admin_verified: bool = Depends(verify_admin)):
+    try:
+        start, end = analytics_date_range(date_from, date_to)
+        rollups = await load_rollups(start, end, source,
+                                     {"_id": 0, "date": 1, "orders": 1, "revenue": 1, "items_sold": 1})
+        days = [{"date": rollup["date"], "orders": rollup.get("orders", 0), "revenue": rollup.get("revenue", 0),
+                 "items_sold": rollup.get("items_sold", 0)} for rollup in rollups]
+        return {"date_from": start, "date_to": end, "days": days,
+                "total_orders": sum(day["orders"] for day in days),
+                "total_revenue": sum(day["revenue"] for day in days)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching analytics: {str(e)}")
+
+@app.get("/api/admin/analytics/top-products")
+async def get_top_products(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                           limit: int = Query(10, ge=1, le=100),
+                           by: str = Query("quantity", pattern="^(quantity|revenue)$"),
+                           source: str = Query("rollups", pattern="^(rollups|orders)$"),
+                           admin_verified: bool = Depends(verify_admin)):
+    try:
+        start, end = analytics_date_range(date_from, date_to)
+        rollups = await load_rollups(start, end, source, {"_id": 0, "products": 1})
+        totals: Dict[str, dict] = {}
+        for rollup in rollups:
+            for product_id, stats in rollup.get("products", {}).items():
+                total = totals.setdefault(product_id, {"id": product_id, "name": stats.get("name", ""),
+                                                       "quantity": 0, "revenue": 0})
+                total["quantity"] += stats.get("quantity", 0)
+                total["revenue"] += stats.get("revenue", 0)
+        ranked = sorted((total for total in totals.values() if total["quantity"] > 0),
+                        key=lambda total: total[by], reverse=True)
+        return {"date_from": start, "date_to": end, "products": ranked[:limit]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching analytics: {str(e)}")
+
+@app.get("/api/admin/analytics/hourly")
+async def get_hourly_analytics(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                               source: str = Query("rollups", pattern="^(rollups|orders)$"),
+                               admin_verified: bool = Depends(verify_admin)):
+    try:
+        start, end = analytics_date_range(date_from, date_to)
+        rollups = await load_rollups(start, end, source, {"_id": 0, "hours": 1})
+        hours = [{"hour": hour, "orders": 0, "revenue": 0} for hour in range(24)]
+        for rollup in rollups:
+            for hour, stats in rollup.get("hours", {}).items():
+                hours[int(hour)]["orders"] += stats.get("orders", 0)
+                hours[int(hour)]["revenue"] += stats.get("revenue", 0)
+        return {"date_from": start, "date_to": end, "hours": hours}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching analytics: {str(e)}")
+
 @app.get("/api/admin/products")
-async def get_admin_products(admin_verified: bool = Depends(verify_admin)) -> List[Product]:
+async def get_admin_products(fields: Optional[str] = None,
+                             admin_verified: bool = Depends(verify_admin)) -> List[Product]:
     try:
-        products = await collection_products.find().to_list(length=None)
-        return [Product(**product) for product in products]
+        selected = parse_product_fields(fields)
+        projection = model_projection(Product, selected) if selected else PRODUCT_PROJECTION
+        products = await collection_products.find({}, projection).to_list(length=None)
+        return json_response(products)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching products: {str(e)}")
 
@@ -258,20 +2949,105 @@ async def create_product(product: Product, admin_verified: bool = Depends(verify
     try:
         product_dict = product.dict()
         await collection_products.insert_one(product_dict)
+        product_search.upsert(product.dict())
+        await catalog_changed([product.id])
         return {"message": "Product created successfully", "product_id": product.id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating product: {str(e)}")
 
+@app.post("/api/admin/products/bulk")
+async def bulk_upsert_products(request: Request, ordered: bool = False, strict: bool = False,
+                               admin_verified: bool = Depends(verify_admin)):
+    try:
+        rows = await read_product_rows(request)
+        if len(rows) > PRODUCT_IMPORT_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"At most {PRODUCT_IMPORT_MAX_ROWS} rows per import")
+        
+        # Everything is validated before anything is written
+        products, report = validate_product_rows(rows)
+        invalid = sum(1 for entry in report if not entry["ok"])
+        if strict and invalid:
+            return JSONResponse({"applied": False, "invalid": invalid, "rows": report}, status_code=422)
+        
+        write_errors = {}
+        upserted = set()
+        if products:
+            operations = [UpdateOne({"id": product.id}, product_upsert(product), upsert=True)
+                          for _, product in products]
+            try:
+                result = await collection_products.bulk_write(operations, ordered=ordered)
+                upserted = set(result.upserted_ids)
+            except BulkWriteError as e:
+                write_errors = {error["index"]: error["errmsg"] for error in e.details.get("writeErrors", [])}
+                upserted = {entry["index"] for entry in e.details.get("upserted", [])}
+                # An ordered write stops at the first error; later rows were never attempted
+                if ordered and write_errors:
+                    first_error = min(write_errors)
+                    for position in range(first_error + 1, len(operations)):
+                        write_errors.setdefault(position, "Not attempted after an earlier error in an ordered import")
+            
+            for position, (index, product) in enumerate(products):
+                entry = report[index]
+                if position in write_errors:
+                    entry.update({"ok": False, "errors": [write_errors[position]]})
+                else:
+                    entry["action"] = "inserted" if position in upserted else "updated"
+            # Updated rows may keep stored fields the import left out, so index what was actually written
+            await reindex_products([product.id for _, product in products])
+            await catalog_changed([product.id for _, product in products])
+        
+        applied = [entry for entry in report if entry.get("action")]
+        return {
+            "applied": bool(applied),
+            "inserted": sum(1 for entry in applied if entry["action"] == "inserted"),
+            "updated": sum(1 for entry in applied if entry["action"] == "updated"),
+            "failed": len(report) - len(applied),
+            "rows": report,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error importing products: {str(e)}")
+
+@app.post("/api/admin/products/{product_id}/image")
+async def upload_product_image(product_id: str, file: UploadFile = File(...),
+                               admin_verified: bool = Depends(verify_admin)):
+    try:
+        data = await file.read(IMAGE_MAX_UPLOAD_BYTES + 1)
+        if len(data) > IMAGE_MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Image larger than {IMAGE_MAX_UPLOAD_BYTES} bytes")
+        if not await collection_products.find_one({"id": product_id}, {"_id": 0, "id": 1}):
+            raise HTTPException(status_code=404, detail="Product not found")
+        
+        variants = await store_image_variants(data)
+        image_url = primary_image_url(variants)
+        await collection_products.update_one(
+            {"id": product_id},
+            {"$set": {"image_variants": variants, "image_url": image_url}}
+        )
+        await reindex_products([product_id])
+        await catalog_changed([product_id])
+        return {"message": "Image uploaded successfully", "image_url": image_url, "image_variants": variants}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error uploading image: {str(e)}")
+
 @app.put("/api/admin/products/{product_id}")
 async def update_product(product_id: str, product: Product, admin_verified: bool = Depends(verify_admin)):
     try:
         product_dict = product.dict()
+        # Variants are built by the image upload and regenerate-images; the edit form doesn't send them
+        if "image_variants" not in product.model_fields_set:
+            product_dict.pop("image_variants")
         result = await collection_products.update_one(
             {"id": product_id}, 
             {"$set": product_dict}
         )
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Product not found")
+        await reindex_products([product_id, product.id])
+        await catalog_changed([product_id, product.id])
         return {"message": "Product updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating product: {str(e)}")
@@ -282,6 +3058,8 @@ async def delete_product(product_id: str, admin_verified: bool = Depends(verify_
         result = await collection_products.delete_one({"id": product_id})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Product not found")
+        product_search.remove(product_id)
+        await catalog_changed([product_id])
         return {"message": "Product deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting product: {str(e)}")
@@ -291,10 +3069,162 @@ async def create_category(category: Category, admin_verified: bool = Depends(ver
     try:
         category_dict = category.dict()
         await collection_categories.insert_one(category_dict)
+        await catalog_changed([])
         return {"message": "Category created successfully", "category_id": category.id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating category: {str(e)}")
 
+@app.put("/api/admin/categories/{category_id}")
+async def update_category(category_id: str, update: CategoryUpdate, admin_verified: bool = Depends(verify_admin)):
+    try:
+        changes = {field: value for field, value in update.dict().items() if value is not None}
+        if changes:
+            found = (await collection_categories.update_one({"id": category_id}, {"$set": changes})).matched_count
+        else:
+            found = await collection_categories.count_documents({"id": category_id}, limit=1)
+        if not found:
+            raise HTTPException(status_code=404, detail="Category not found")
+        
+        # A crash between the two writes is repaired by the reconciliation job
+        products_updated = await propagate_category_name(category_id, changes["name"]) if "name" in changes else 0
+        if products_updated:
+            await rebuild_search_index()
+        await catalog_changed(None if products_updated else [])
+        return {"message": "Category updated successfully", "products_updated": products_updated}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating category: {str(e)}")
+
+@app.post("/api/admin/categories/reconcile")
+async def reconcile_categories(admin_verified: bool = Depends(verify_admin)):
+    try:
+        return await reconcile_category_names()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reconciling categories: {str(e)}")
+
+@app.get("/api/admin/cache/stats")
+async def get_cache_stats(admin_verified: bool = Depends(verify_admin)):
+    return {"catalog": catalog_cache.stats(), "search": product_search.stats()}
+
+@app.get("/api/media/{name}")
+async def get_media(name: str):
+    # Names are content hashes, so a given URL never changes and can be cached forever
+    if not MEDIA_NAME_PATTERN.match(name) or not (MEDIA_ROOT / name).is_file():
+        raise HTTPException(status_code=404, detail="Not found")
+    media_type = "image/webp" if name.endswith(".webp") else "image/jpeg"
+    return FileResponse(MEDIA_ROOT / name, media_type=media_type, headers={"Cache-Control": MEDIA_CACHE_CONTROL})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    for status_name in ("pending", "sending"):
+        outbox_depth.set(status_name, value=await collection_outbox.count_documents({"status": status_name}))
+    for event, value in catalog_cache.stats().items():
+        if event in ("hits", "misses", "invalidations"):
+            cache_events.set(event, value=value)
+    
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.get("/api/health")
+async def health():
+    pools = mongo_pool_listener.snapshot()
+    max_pool_size = mongo_max_pool_size
+    checked_out = sum(pool["checked_out"] for pool in pools.values())
+    waiting = sum(pool["waiting"] for pool in pools.values())
+    report = {
+        "status": "ok",
+        "worker": cluster_bus.origin,
+        "mongo": {"ok": True},
+        "pool": {
+            "max_size": max_pool_size,
+            "servers": pools,
+            "checked_out": checked_out,
+            "waiting": waiting,
+            # Per server, the busiest one decides; a full pool makes requests queue
+            "utilisation": round(max((pool["checked_out"] for pool in pools.values()), default=0)
+                                 / max_pool_size, 3) if max_pool_size else None,
+        },
+    }
+    
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=HEALTH_PING_TIMEOUT_SECONDS)
+        report["mongo"]["ping_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    except Exception as e:
+        report["status"] = "down"
+        report["mongo"] = {"ok": False, "error": str(e) or type(e).__name__}
+        return JSONResponse(report, status_code=503)
+    
+    if waiting or (report["pool"]["utilisation"] or 0) >= 0.9:
+        report["status"] = "degraded"
+    return report
+
 @app.get("/")
 async def root():
-    return {"message": "Pempek Domino API is running!"}
\ No newline at end of file
+    return {"message": "Pempek Domino API is running!"}
+
+# Command line maintenance tasks
+async def run_regenerate_images_command(force: bool, concurrency: int) -> dict:
+    # So running servers drop their cached catalog and pick up the new variants
+    await cluster_bus.start_publisher()
+    return await regenerate_product_images(force, concurrency)
+
+async def run_reconcile_categories_command() -> dict:
+    # Fixed names change every cached product list, so running servers reload them all
+    await cluster_bus.start_publisher()
+    return await reconcile_category_names()
+
+async def run_index_command(check: bool) -> int:
+    if check:
+        report = await check_query_plans()
+        for entry in report:
+            state = "COLLSCAN" if entry["collection_scan"] else "indexed"
+            print(f"{state:9} {entry['query']} ({' <- '.join(entry['stages'])})")
+        return 1 if any(entry["collection_scan"] for entry in report) else 0
+    
+    report = await ensure_indexes()
+    for entry in report:
+        print(f"{'ok' if entry['ok'] else 'FAILED':6} {entry['collection']}.{entry['index']}")
+    return 0 if all(entry["ok"] for entry in report) else 1
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pempek Domino backend maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    indexes = commands.add_parser("indexes", help="Create the MongoDB indexes the API relies on")
+    indexes.add_argument("--check", action="store_true",
+                         help="Only report which queries would still do a collection scan")
+    
+    backfill = commands.add_parser("backfill-rollups", help="Rebuild sales analytics rollups from order history")
+    backfill.add_argument("--date-from", help="First day to rebuild (YYYY-MM-DD), default: first order")
+    backfill.add_argument("--date-to", help="Last day to rebuild (YYYY-MM-DD), default: yesterday. "
+                                        "Include today only while no orders are being placed")
+    
+    images = commands.add_parser("regenerate-images", help="Build resized image variants for products")
+    images.add_argument("--force", action="store_true", help="Also rebuild products that already have variants")
+    images.add_argument("--concurrency", type=int, default=4, help="Images processed at the same time")
+    
+    commands.add_parser("reconcile-categories", help="Copy category names onto products that drifted")
+    
+    args = parser.parse_args(argv)
+    if args.command == "reconcile-categories":
+        report = asyncio.run(run_reconcile_categories_command())
+        print(f"Fixed {report['fixed']} product(s); {report['orphaned']} reference a missing category")
+        return 0
+    if args.command == "regenerate-images":
+        report = asyncio.run(run_regenerate_images_command(args.force, args.concurrency))
+        print(f"Regenerated images for {report['processed']} product(s), {report['failed']} failed")
+        return 1 if report["failed"] else 0
+    if args.command == "indexes":
+        return asyncio.run(run_index_command(args.check))
+    if args.command == "backfill-rollups":
+        days = asyncio.run(backfill_rollups(args.date_from, args.date_to))
+        print(f"Rebuilt sales rollups for {days} day(s)")
+        return 0
+    return 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Load testing and latency benchmark for the Pempek Domino API
+Drives mixed catalog / checkout / admin workloads and reports per-route latency
+
+By default the backend is booted in-process against an in-memory MongoDB stand-in
+(mongomock-motor) and a fake Telegram endpoint, so no external services are needed:
+
+    python backend_benchmark.py --concurrency 50 --duration 30 --output bench.json
+
+Use --mongo-url to run against a real local MongoDB instead, or --base-url to
+benchmark an already running server over HTTP.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import httpx
+
+ADMIN_USERNAME = os.environ.setdefault("ADMIN_USERNAME", "benchadmin")
+ADMIN_PASSWORD = os.environ.setdefault("ADMIN_PASSWORD", "benchpassword")
+
+DEFAULT_MIX = "catalog=70,checkout=20,admin=10"
+
+
+class FakeTelegram:
+    """Stands in for api.telegram.org with a configurable response latency"""
+
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000
+        self.messages = 0
+
+    async def handle(self, request):
+        await asyncio.sleep(self.latency)
+        self.messages += 1
+        return httpx.Response(200, json={"ok": True, "result": {"message_id": self.messages}})
+
+
+async def boot_in_process(args):
+    """Import backend/server.py, point it at the chosen Mongo and the fake Telegram, run startup"""
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark-token")
+    os.environ.setdefault("TELEGRAM_CHAT_ID", "0")
+    # Every virtual user shares one client address, so lift the per-client rate limits
+    for name in ("ORDER_RATE_PER_IP", "ORDER_RATE_PER_PHONE", "LOGIN_RATE_PER_IP"):
+        os.environ.setdefault(name, "1000000/1,1000000")
+    if args.mongo_url:
+        os.environ["MONGO_URL"] = args.mongo_url
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    import server
+
+    if not args.mongo_url:
+        try:
+            import mongomock_motor
+        except ImportError:
+            raise SystemExit("mongomock-motor is required for the in-memory stand-in "
+                             "(pip install mongomock-motor), or pass --mongo-url")
+        server.client = mongomock_motor.AsyncMongoMockClient()
+        server.db = server.client["pempek_domino"]
+        for name in dir(server):
+            if name.startswith("collection_"):
+                setattr(server, name, server.db[getattr(server, name).name])
+
+    telegram = FakeTelegram(args.telegram_latency_ms)
+    server.http_client = httpx.AsyncClient(transport=httpx.MockTransport(telegram.handle))
+    await server.app.router.startup()
+
+    # Keep checkouts from running out of stock halfway through the run
+    await server.collection_products.update_many({}, {"$set": {"stock": 10 ** 9}})
+    if args.seed_orders:
+        await seed_orders(server, args.seed_orders)
+
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app),
+                             base_url="http://benchmark", timeout=args.timeout)
+    return server, http, telegram
+
+
+async def seed_orders(server, count):
+    """Pre-populate the orders collection so admin listing has realistic volume"""
+    start = datetime.now() - timedelta(days=30)
+    orders = []
+    for i in range(count):
+        created_at = start + timedelta(seconds=i * (30 * 24 * 3600 / count))
+        orders.append({
+            "id": str(uuid.uuid4()),
+            "customer_name": f"Pelanggan {i}",
+            "customer_phone": f"08{i % 10000:010d}",
+            "customer_address": "Jl. Sudirman No. 123, Palembang",
+            "items": [{"id": str(uuid.uuid4()), "name": "Pempek Lenjer", "price": 8000,
+                       "quantity": 2, "subtotal": 16000}],
+            "total_amount": 16000,
+            "status": "pending",
+            "created_at": created_at.isoformat(),
+        })
+    for offset in range(0, count, 1000):
+        await server.collection_orders.insert_many(orders[offset:offset + 1000])
+
+
+class Recorder:
+    """Collects per-route latency samples and status codes"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.failures = defaultdict(int)
+
+    async def request(self, http, route, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await http.request(method, url, **kwargs)
+        except Exception:
+            self.failures[route] += 1
+            return None
+        self.latencies[route].append(time.perf_counter() - start)
+        self.statuses[route][response.status_code] += 1
+        if response.status_code >= 500:
+            self.failures[route] += 1
+        return response
+
+
+class Workload:
+    """One virtual user: picks a scenario by weight and runs it until the deadline"""
+
+    def __init__(self, http, recorder, mix, catalog, admin_headers):
+        self.http = http
+        self.recorder = recorder
+        self.scenarios = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.categories, self.products = catalog
+        self.admin_headers = admin_headers
+        # Like a browser cache: revalidate with the last ETag seen per URL
+        self.etags = {}
+
+    async def get_cached(self, route, url):
+        headers = {"If-None-Match": self.etags[url]} if url in self.etags else {}
+        response = await self.recorder.request(self.http, route, "GET", url, headers=headers)
+        if response is not None and "etag" in response.headers:
+            self.etags[url] = response.headers["etag"]
+
+    async def catalog(self):
+        # A storefront page load, then the typeahead search
+        await self.get_cached("GET /api/storefront", "/api/storefront")
+        term = random.choice(self.products)["name"].split()[-1][:3] if self.products else "pem"
+        await self.recorder.request(self.http, "GET /api/products/search", "GET", f"/api/products/search?q={term}")
+
+    async def checkout(self):
+        items = [{"id": product["id"], "quantity": random.randint(1, 3)}
+                 for product in random.sample(self.products, k=min(len(self.products), random.randint(1, 3)))]
+        order = {
+            "customer_name": "Budi Santoso",
+            "customer_phone": f"08{random.randint(0, 10 ** 10):010d}",
+            "customer_address": "Jl. Sudirman No. 123, Palembang",
+            "items": items,
+        }
+        await self.recorder.request(self.http, "POST /api/orders", "POST", "/api/orders",
+                                    json=order, headers={"Idempotency-Key": str(uuid.uuid4())})
+
+    async def admin(self):
+        await self.recorder.request(self.http, "GET /api/admin/orders", "GET", "/api/admin/orders?limit=50",
+                                    headers=self.admin_headers)
+
+    async def run(self, deadline, remaining):
+        while time.perf_counter() < deadline:
+            if remaining is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            scenario = random.choices(self.scenarios, weights=self.weights)[0]
+            await getattr(self, scenario)()
+
+
+def parse_mix(value):
+    mix = []
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("catalog", "checkout", "admin"):
+            raise argparse.ArgumentTypeError(f"Unknown scenario: {name}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    rank = max(0, min(len(sorted_samples) - 1, int(round(pct / 100 * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[rank]
+
+
+def build_report(recorder, elapsed, args):
+    routes = {}
+    for route in sorted(set(recorder.latencies) | set(recorder.failures)):
+        samples = sorted(recorder.latencies[route])
+        routes[route] = {
+            "requests": len(samples),
+            "failures": recorder.failures[route],
+            "rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(samples, 50) * 1000, 3),
+            "p95_ms": round(percentile(samples, 95) * 1000, 3),
+            "p99_ms": round(percentile(samples, 99) * 1000, 3),
+            "max_ms": round(samples[-1] * 1000, 3) if samples else 0.0,
+            "status_codes": {str(code): count for code, count in sorted(recorder.statuses[route].items())},
+        }
+    total = sum(route["requests"] for route in routes.values())
+    return {
+        "started_at": args.started_at,
+        "target": args.base_url or ("mongodb:" + args.mongo_url if args.mongo_url else "in-memory"),
+        "concurrency": args.concurrency,
+        "duration_s": round(elapsed, 3),
+        "mix": dict(args.mix),
+        "total_requests": total,
+        "total_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "routes": routes,
+    }
+
+
+def print_report(report):
+    print("=" * 80)
+    print("PEMPEK DOMINO API BENCHMARK")
+    print("=" * 80)
+    print(f"Target: {report['target']}  Concurrency: {report['concurrency']}  "
+          f"Duration: {report['duration_s']}s")
+    print()
+    print(f"{'Route':28} {'Reqs':>7} {'Fail':>5} {'RPS':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, stats in report["routes"].items():
+        print(f"{route:28} {stats['requests']:>7} {stats['failures']:>5} {stats['rps']:>9.1f} "
+              f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}")
+    print()
+    print(f"Total: {report['total_requests']} requests, {report['total_rps']} req/s")
+    print("=" * 80)
+
+
+async def run_benchmark(args):
+    server = telegram = None
+    if args.base_url:
+        http = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+    else:
+        server, http, telegram = await boot_in_process(args)
+
+    try:
+        categories = (await http.get("/api/categories")).json()
+        products = (await http.get("/api/products")).json()
+        login = await http.post("/api/admin/login", json={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD})
+        admin_headers = {"Authorization": f"Bearer {login.json().get('access_token', '')}"}
+        if login.status_code != 200:
+            print(f"Admin login failed (HTTP {login.status_code}), admin requests will return 401")
+
+        recorder = Recorder()
+        remaining = [args.requests] if args.requests else None
+        deadline = time.perf_counter() + (args.duration if not args.requests else float("inf"))
+        users = [Workload(http, recorder, args.mix, (categories, products), admin_headers)
+                 for _ in range(args.concurrency)]
+
+        start = time.perf_counter()
+        await asyncio.gather(*[user.run(deadline, remaining) for user in users])
+        elapsed = time.perf_counter() - start
+
+        report = build_report(recorder, elapsed, args)
+        if telegram is not None:
+            report["telegram_messages"] = telegram.messages
+        return report
+    finally:
+        await http.aclose()
+        if server is not None:
+            await server.app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Pempek Domino API")
+    parser.add_argument("--base-url", help="Benchmark a running server instead of booting one in-process")
+    parser.add_argument("--mongo-url", help="Boot against this MongoDB instead of the in-memory stand-in")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=10, help="Run time in seconds")
+    parser.add_argument("--requests", type=int, help="Stop after this many scenarios instead of --duration")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Scenario weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--seed-orders", type=int, default=1000, help="Orders to pre-load in-process")
+    parser.add_argument("--telegram-latency-ms", type=float, default=150, help="Fake Telegram response time")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible workloads")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--json", action="store_true", help="Print the JSON report instead of a table")
+    args = parser.parse_args()
+    args.started_at = datetime.now().isoformat()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    report = asyncio.run(run_benchmark(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failed = sum(route["failures"] for route in report["routes"].values())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
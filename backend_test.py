@@ -6,6 +6,7 @@ Tests all backend endpoints systematically
 
 import requests
 import json
+import time
 import uuid
 from datetime import datetime
 
@@ -36,6 +37,45 @@ class PempekDominoTester:
             print(f"   Details: {details}")
         print()
 
+    def post_order(self, **kwargs):
+        """POST /api/orders, waiting once for the rate limit if earlier tests used up the burst"""
+        response = requests.post(f"{self.base_url}/orders", **kwargs)
+        if response.status_code == 429:
+            time.sleep(float(response.headers.get("Retry-After", "1")))
+            response = requests.post(f"{self.base_url}/orders", **kwargs)
+        return response
+
+    def read_sse_event(self, lines):
+        """Read the next event from a text/event-stream, skipping retry hints and keep-alive comments"""
+        event = {}
+        for line in lines:
+            if not line:
+                if "event" in event:
+                    return event
+                continue
+            field, _, value = line.partition(": ")
+            if field in ("id", "event", "data"):
+                event[field] = value
+        return None
+
+    def test_health_endpoint(self):
+        """Test GET /api/health reports MongoDB ping latency and pool utilisation"""
+        try:
+            response = requests.get(f"{self.base_url}/health", timeout=10)
+            data = response.json()
+            
+            if response.status_code == 200 and data.get('mongo', {}).get('ok') and 'pool' in data:
+                self.log_test("Health Check", True,
+                            f"Status {data['status']}, ping {data['mongo'].get('ping_ms')} ms",
+                            f"Pool: {data['pool']}")
+            else:
+                self.log_test("Health Check", False,
+                            f"HTTP {response.status_code}",
+                            response.text)
+                
+        except Exception as e:
+            self.log_test("Health Check", False, f"Request failed: {str(e)}")
+
     def test_database_initialization(self):
         """Test if database is properly initialized with categories and products"""
         try:
@@ -114,6 +154,35 @@ class PempekDominoTester:
         except Exception as e:
             self.log_test("Categories API", False, f"Request failed: {str(e)}")
 
+    def test_storefront_endpoint(self):
+        """Test GET /api/storefront returns categories with products grouped by category id"""
+        try:
+            response = requests.get(f"{self.base_url}/storefront", timeout=10)
+            
+            if response.status_code == 200:
+                data = response.json()
+                categories = data.get('categories', [])
+                grouped = data.get('products', {})
+                misplaced = [product['name'] for category_id, products in grouped.items()
+                             for product in products if product.get('category_id') != category_id]
+                
+                if categories and all(category['id'] in grouped for category in categories) and not misplaced:
+                    total = sum(len(products) for products in grouped.values())
+                    self.log_test("Storefront API", True,
+                                f"Returned {len(categories)} categories and {total} products",
+                                f"ETag: {response.headers.get('etag')}")
+                else:
+                    self.log_test("Storefront API", False,
+                                "Categories and product groups don't line up",
+                                f"Misplaced products: {misplaced}")
+            else:
+                self.log_test("Storefront API", False,
+                            f"HTTP {response.status_code}",
+                            response.text)
+                
+        except Exception as e:
+            self.log_test("Storefront API", False, f"Request failed: {str(e)}")
+
     def test_products_endpoint(self):
         """Test GET /api/products endpoint with and without category filter"""
         try:
@@ -190,48 +259,51 @@ class PempekDominoTester:
     def test_order_creation(self):
         """Test POST /api/orders endpoint and Telegram notification"""
         try:
-            # Create a realistic test order
+            products = requests.get(f"{self.base_url}/products", timeout=10).json()
+            if len(products) < 2:
+                self.log_test("Order Creation", False, "Need at least 2 products to build a test order")
+                return
+            
+            # Create a realistic test order; prices come from the catalog, not the client
             test_order = {
                 "customer_name": "Budi Santoso",
                 "customer_phone": "081234567890",
                 "customer_address": "Jl. Sudirman No. 123, Palembang",
                 "items": [
-                    {
-                        "id": str(uuid.uuid4()),
-                        "name": "Pempek Kapal Selam",
-                        "price": 15000,
-                        "quantity": 2,
-                        "subtotal": 30000
-                    },
-                    {
-                        "id": str(uuid.uuid4()),
-                        "name": "Pempek Lenjer",
-                        "price": 8000,
-                        "quantity": 3,
-                        "subtotal": 24000
-                    }
-                ],
-                "total_amount": 54000
+                    {"id": products[0]["id"], "quantity": 2},
+                    {"id": products[1]["id"], "quantity": 1}
+                ]
             }
+            expected_total = products[0]["price"] * 2 + products[1]["price"]
+            idempotency_key = str(uuid.uuid4())
             
-            response = requests.post(f"{self.base_url}/orders", 
-                                   json=test_order, 
-                                   headers={"Content-Type": "application/json"},
-                                   timeout=15)
+            response = self.post_order(json=test_order,
+                                       headers={"Content-Type": "application/json",
+                                                "Idempotency-Key": idempotency_key},
+                                       timeout=15)
             
             if response.status_code == 200:
                 result = response.json()
                 
                 if "order_id" in result and "message" in result:
+                    if result.get("total_amount") != expected_total:
+                        self.log_test("Order Creation", False,
+                                    "Server total does not match catalog prices",
+                                    f"Expected: {expected_total}, Got: {result.get('total_amount')}")
+                        return
+                    
                     self.log_test("Order Creation", True,
                                 f"Order created successfully: {result.get('message')}",
-                                f"Order ID: {result.get('order_id')}")
+                                f"Order ID: {result.get('order_id')}, Total: Rp {expected_total}")
                     
                     # Note: We can't directly verify Telegram notification without access to the chat
                     # But the endpoint should handle it gracefully
                     self.log_test("Telegram Integration", True,
                                 "Order endpoint includes Telegram notification (check Telegram chat for message)",
                                 f"Bot token configured, Chat ID: 5100924103")
+                    
+                    self.test_order_idempotency(test_order, idempotency_key, result)
+                    self.test_order_stock_limit(products[0])
                 else:
                     self.log_test("Order Creation", False,
                                 "Invalid response format",
@@ -244,6 +316,60 @@ class PempekDominoTester:
         except Exception as e:
             self.log_test("Order Creation", False, f"Request failed: {str(e)}")
 
+    def test_order_idempotency(self, order, idempotency_key, first_result):
+        """Test that retrying with the same Idempotency-Key replays the order instead of placing it twice"""
+        try:
+            headers = {"Content-Type": "application/json", "Idempotency-Key": idempotency_key}
+            replay = self.post_order(json=order, headers=headers, timeout=15)
+            
+            if (replay.status_code == 200 and replay.headers.get("Idempotent-Replayed") == "true"
+                    and replay.json().get("order_id") == first_result.get("order_id")):
+                self.log_test("Order Idempotency Replay", True, "Retry returned the original order",
+                            f"Order ID: {first_result.get('order_id')}")
+            else:
+                self.log_test("Order Idempotency Replay", False,
+                            f"HTTP {replay.status_code}, replayed: {replay.headers.get('Idempotent-Replayed')}",
+                            replay.text)
+            
+            changed_order = {**order, "customer_address": "Jl. Kapten Rivai No. 7, Palembang"}
+            mismatch = self.post_order(json=changed_order, headers=headers, timeout=15)
+            if mismatch.status_code == 422:
+                self.log_test("Order Idempotency Mismatch", True, "Key reused with a different order rejected",
+                            f"Detail: {mismatch.json().get('detail')}")
+            else:
+                self.log_test("Order Idempotency Mismatch", False,
+                            f"Expected HTTP 422, got {mismatch.status_code}",
+                            mismatch.text)
+                
+        except Exception as e:
+            self.log_test("Order Idempotency", False, f"Request failed: {str(e)}")
+
+    def test_order_stock_limit(self, product):
+        """Test that orders exceeding available stock are rejected"""
+        try:
+            oversized_order = {
+                "customer_name": "Budi Santoso",
+                "customer_phone": "081234567890",
+                "customer_address": "Jl. Sudirman No. 123, Palembang",
+                "items": [{"id": product["id"], "quantity": product["stock"] + 1}]
+            }
+            
+            response = self.post_order(json=oversized_order,
+                                       headers={"Content-Type": "application/json"},
+                                       timeout=15)
+            
+            if response.status_code == 409:
+                self.log_test("Order Stock Limit", True,
+                            "Order exceeding stock rejected",
+                            f"Detail: {response.json().get('detail')}")
+            else:
+                self.log_test("Order Stock Limit", False,
+                            f"Expected HTTP 409, got {response.status_code}",
+                            response.text)
+                
+        except Exception as e:
+            self.log_test("Order Stock Limit", False, f"Request failed: {str(e)}")
+
     def test_admin_login(self):
         """Test POST /api/admin/login endpoint"""
         try:
@@ -290,16 +416,18 @@ class PempekDominoTester:
                                   timeout=10)
             
             if response.status_code == 200:
-                orders = response.json()
+                page = response.json()
+                orders = page.get("orders") if isinstance(page, dict) else None
                 
-                if isinstance(orders, list):
+                if isinstance(orders, list) and "next_cursor" in page:
                     self.log_test("Admin Orders", True,
                                 f"Successfully retrieved {len(orders)} orders",
                                 f"Orders endpoint accessible with admin token")
+                    self.test_admin_orders_pagination(headers, page)
                 else:
                     self.log_test("Admin Orders", False,
                                 "Invalid response format",
-                                f"Response: {orders}")
+                                f"Response: {page}")
             else:
                 self.log_test("Admin Orders", False,
                             f"HTTP {response.status_code}",
@@ -308,6 +436,238 @@ class PempekDominoTester:
         except Exception as e:
             self.log_test("Admin Orders", False, f"Request failed: {str(e)}")
 
+    def test_admin_orders_pagination(self, headers, first_page):
+        """Test cursor pagination and filters on GET /api/admin/orders"""
+        try:
+            response = requests.get(f"{self.base_url}/admin/orders",
+                                  params={"limit": 1},
+                                  headers=headers,
+                                  timeout=10)
+            
+            if response.status_code != 200:
+                self.log_test("Admin Orders (Pagination)", False,
+                            f"HTTP {response.status_code}",
+                            response.text)
+                return
+            
+            page = response.json()
+            if len(page["orders"]) > 1:
+                self.log_test("Admin Orders (Pagination)", False,
+                            f"Limit ignored, got {len(page['orders'])} orders")
+                return
+            
+            if page["next_cursor"]:
+                next_response = requests.get(f"{self.base_url}/admin/orders",
+                                           params={"limit": 1, "cursor": page["next_cursor"]},
+                                           headers=headers,
+                                           timeout=10)
+                next_orders = next_response.json().get("orders", [])
+                if next_orders and next_orders[0]["id"] == page["orders"][0]["id"]:
+                    self.log_test("Admin Orders (Pagination)", False,
+                                "Second page repeated the first page")
+                    return
+            
+            filtered = requests.get(f"{self.base_url}/admin/orders",
+                                  params={"status": "pending"},
+                                  headers=headers,
+                                  timeout=10).json()
+            wrong_status = [o["id"] for o in filtered["orders"] if o["status"] != "pending"]
+            if wrong_status:
+                self.log_test("Admin Orders (Pagination)", False,
+                            f"Status filter returned {len(wrong_status)} non-pending orders")
+                return
+            
+            self.log_test("Admin Orders (Pagination)", True,
+                        "Limit, cursor and status filter behave correctly",
+                        f"First page size: {len(first_page['orders'])}")
+                
+        except Exception as e:
+            self.log_test("Admin Orders (Pagination)", False, f"Request failed: {str(e)}")
+
+    def test_order_status_transitions(self):
+        """Test PATCH /api/admin/orders/{id} and POST /api/admin/orders/bulk-status transitions"""
+        if not self.admin_token:
+            self.log_test("Order Status Transitions", False, "No admin token available")
+            return
+        
+        headers = {"Authorization": f"Bearer {self.admin_token}"}
+        try:
+            product = requests.get(f"{self.base_url}/products", timeout=10).json()[0]
+            order = {
+                "customer_name": "Siti Aminah",
+                "customer_phone": "081298765432",
+                "customer_address": "Jl. Merdeka No. 45, Palembang",
+                "items": [{"id": product["id"], "quantity": 1}]
+            }
+            order_id = self.post_order(json=order, timeout=15).json().get("order_id")
+            
+            skipped = requests.patch(f"{self.base_url}/admin/orders/{order_id}", json={"status": "delivered"},
+                                   headers=headers, timeout=10)
+            confirmed = requests.patch(f"{self.base_url}/admin/orders/{order_id}", json={"status": "confirmed"},
+                                     headers=headers, timeout=10)
+            if skipped.status_code == 409 and confirmed.status_code == 200 \
+                    and confirmed.json().get("status") == "confirmed":
+                self.log_test("Order Status Update", True, "pending -> delivered refused, pending -> confirmed applied")
+            else:
+                self.log_test("Order Status Update", False,
+                            f"Expected HTTP 409 then 200, got {skipped.status_code} then {confirmed.status_code}",
+                            confirmed.text)
+            
+            missing_id = str(uuid.uuid4())
+            response = requests.post(f"{self.base_url}/admin/orders/bulk-status",
+                                   json={"order_ids": [order_id, missing_id], "status": "cancelled"},
+                                   headers=headers, timeout=10)
+            results = {result["id"]: result for result in response.json().get("results", [])} \
+                if response.status_code == 200 else {}
+            # A cancelled order is final, so a second transition must be refused per order
+            again = requests.post(f"{self.base_url}/admin/orders/bulk-status",
+                                json={"order_ids": [order_id], "status": "confirmed"},
+                                headers=headers, timeout=10)
+            if (response.status_code == 200 and response.json().get("updated") == 1
+                    and results.get(order_id, {}).get("ok") and not results.get(missing_id, {}).get("ok", True)
+                    and again.status_code == 200 and again.json().get("updated") == 0):
+                self.log_test("Bulk Order Status", True, "Order cancelled, unknown and final orders reported per id",
+                            f"Results: {list(results.values())}")
+            else:
+                self.log_test("Bulk Order Status", False,
+                            f"HTTP {response.status_code} / {again.status_code}",
+                            f"{response.text} / {again.text}")
+        except Exception as e:
+            self.log_test("Order Status Transitions", False, f"Request failed: {str(e)}")
+
+    def test_order_stream(self):
+        """Test GET /api/admin/orders/stream replays missed events after last_event_id and resets stale ones"""
+        if not self.admin_token:
+            self.log_test("Order Stream", False, "No admin token available")
+            return
+        
+        headers = {"Authorization": f"Bearer {self.admin_token}"}
+        
+        def open_stream(last_event_id=None):
+            ticket = requests.post(f"{self.base_url}/admin/orders/stream-ticket", headers=headers,
+                                 timeout=10).json()["ticket"]
+            params = {"ticket": ticket}
+            if last_event_id:
+                params["last_event_id"] = last_event_id
+            return requests.get(f"{self.base_url}/admin/orders/stream", params=params, stream=True, timeout=30)
+        
+        def next_update(lines, order_id, status):
+            event = self.read_sse_event(lines)
+            while event and not (event["event"] == "order_updated"
+                                 and json.loads(event["data"]).get("id") == order_id
+                                 and json.loads(event["data"]).get("status") == status):
+                event = self.read_sse_event(lines)
+            return event
+        
+        try:
+            product = requests.get(f"{self.base_url}/products", timeout=10).json()[0]
+            order = {
+                "customer_name": "Rina Marlina",
+                "customer_phone": "081377788899",
+                "customer_address": "Jl. Kapten Rivai No. 8, Palembang",
+                "items": [{"id": product["id"], "quantity": 1}]
+            }
+            order_id = self.post_order(json=order, timeout=15).json().get("order_id")
+            
+            live = open_stream()
+            lines = live.iter_lines(decode_unicode=True)
+            requests.patch(f"{self.base_url}/admin/orders/{order_id}", json={"status": "confirmed"},
+                         headers=headers, timeout=10)
+            confirmed = next_update(lines, order_id, "confirmed")
+            requests.patch(f"{self.base_url}/admin/orders/{order_id}", json={"status": "cooking"},
+                         headers=headers, timeout=10)
+            cooking = next_update(lines, order_id, "cooking")
+            live.close()
+            if not confirmed or not cooking:
+                self.log_test("Order Stream", False, "Status updates were not pushed to the open stream",
+                            f"Confirmed: {confirmed}, cooking: {cooking}")
+                return
+            
+            # A dashboard that dropped after "confirmed" gets "cooking" replayed on reconnect
+            resumed = open_stream(confirmed["id"])
+            replayed = self.read_sse_event(resumed.iter_lines(decode_unicode=True))
+            resumed.close()
+            if replayed and replayed["id"] == cooking["id"] and replayed["event"] == "order_updated":
+                self.log_test("Order Stream Replay", True, f"Event {cooking['id']} replayed after {confirmed['id']}")
+            else:
+                self.log_test("Order Stream Replay", False, f"Expected event {cooking['id']} first",
+                            f"Got: {replayed}")
+            
+            stale = open_stream("stale-0")
+            reset = self.read_sse_event(stale.iter_lines(decode_unicode=True))
+            stale.close()
+            if reset and reset["event"] == "reset":
+                self.log_test("Order Stream Reset", True, "Unknown last_event_id asks the dashboard to reload")
+            else:
+                self.log_test("Order Stream Reset", False, "Expected a reset event", f"Got: {reset}")
+            
+            requests.patch(f"{self.base_url}/admin/orders/{order_id}", json={"status": "cancelled"},
+                         headers=headers, timeout=10)
+        except Exception as e:
+            self.log_test("Order Stream", False, f"Request failed: {str(e)}")
+
+    def test_orders_export_resume(self):
+        """Test GET /api/admin/orders/export and resuming it with after_id"""
+        if not self.admin_token:
+            self.log_test("Orders Export", False, "No admin token available")
+            return
+        
+        headers = {"Authorization": f"Bearer {self.admin_token}"}
+        try:
+            response = requests.get(f"{self.base_url}/admin/orders/export", headers=headers, timeout=30)
+            orders = [json.loads(line) for line in response.text.splitlines() if line]
+            if response.status_code != 200 or len(orders) < 2:
+                self.log_test("Orders Export", False, f"HTTP {response.status_code}, {len(orders)} orders",
+                            response.text[:500])
+                return
+            
+            # An interrupted download continues after the last order it received
+            resumed = requests.get(f"{self.base_url}/admin/orders/export", params={"after_id": orders[0]["id"]},
+                                 headers=headers, timeout=30)
+            resumed_ids = [json.loads(line)["id"] for line in resumed.text.splitlines() if line]
+            unknown = requests.get(f"{self.base_url}/admin/orders/export", params={"after_id": str(uuid.uuid4())},
+                                 headers=headers, timeout=30)
+            if resumed_ids == [order["id"] for order in orders[1:]] and unknown.status_code == 400:
+                self.log_test("Orders Export Resume", True,
+                            f"Exported {len(orders)} orders; resuming after the first returned the other "
+                            f"{len(resumed_ids)}")
+            else:
+                self.log_test("Orders Export Resume", False,
+                            f"Resume did not continue after the first order (unknown after_id: HTTP "
+                            f"{unknown.status_code})",
+                            f"Expected {len(orders) - 1} orders, got {len(resumed_ids)}")
+        except Exception as e:
+            self.log_test("Orders Export", False, f"Request failed: {str(e)}")
+
+    def test_sales_analytics(self):
+        """Test the analytics endpoints agree with each other and include the test order's products"""
+        if not self.admin_token:
+            self.log_test("Sales Analytics", False, "No admin token available")
+            return
+        
+        headers = {"Authorization": f"Bearer {self.admin_token}"}
+        try:
+            daily = requests.get(f"{self.base_url}/admin/analytics/daily", headers=headers, timeout=10).json()
+            hourly = requests.get(f"{self.base_url}/admin/analytics/hourly", headers=headers, timeout=10).json()
+            top = requests.get(f"{self.base_url}/admin/analytics/top-products", params={"limit": 100},
+                             headers=headers, timeout=10).json()
+            ordered_product = requests.get(f"{self.base_url}/products", timeout=10).json()[0]
+            
+            # Both views are built from the same daily rollups, so their totals must match
+            hourly_orders = sum(hour["orders"] for hour in hourly.get("hours", []))
+            hourly_revenue = sum(hour["revenue"] for hour in hourly.get("hours", []))
+            top_ids = [product["id"] for product in top.get("products", [])]
+            if (daily.get("total_orders", 0) >= 1 and hourly_orders == daily["total_orders"]
+                    and hourly_revenue == daily["total_revenue"] and ordered_product["id"] in top_ids):
+                self.log_test("Sales Analytics", True,
+                            f"{daily['total_orders']} orders, Rp {daily['total_revenue']} in the last 30 days",
+                            f"Top product: {top['products'][0]['name']}")
+            else:
+                self.log_test("Sales Analytics", False, "Daily, hourly and top-product analytics disagree",
+                            f"Daily: {daily}, hourly orders: {hourly_orders}, top products: {top_ids}")
+        except Exception as e:
+            self.log_test("Sales Analytics", False, f"Request failed: {str(e)}")
+
     def test_admin_products_crud(self):
         """Test admin product CRUD operations"""
         if not self.admin_token:
@@ -379,6 +739,201 @@ class PempekDominoTester:
         except Exception as e:
             self.log_test("Admin Products CRUD", False, f"Request failed: {str(e)}")
 
+    def test_bulk_import_keeps_unlisted_fields(self):
+        """Test that re-importing an existing product only overwrites the fields in the row"""
+        if not self.admin_token:
+            self.log_test("Bulk Import Partial Update", False, "No admin token available")
+            return
+        
+        headers = {"Authorization": f"Bearer {self.admin_token}"}
+        product = {
+            "name": "Test Pempek Import",
+            "price": 10000,
+            "category_id": str(uuid.uuid4()),
+            "category_name": "Pempek Goreng",
+            "image_url": "https://images.unsplash.com/photo-1587907988134-94b4d1c3e40e",
+            "stock": 7,
+            "description": "Keep this description",
+            "image_variants": {"jpeg_320": "/api/media/0123456789abcdef-320.jpg"}
+        }
+        product_id = None
+        try:
+            create_response = requests.post(f"{self.base_url}/admin/products", json=product,
+                                          headers=headers, timeout=10)
+            product_id = create_response.json().get("product_id")
+            
+            # A price list import: no stock, description or variants in the row
+            row = {key: product[key] for key in ("name", "category_id", "category_name", "image_url")}
+            row.update({"id": product_id, "price": 12000})
+            import_response = requests.post(f"{self.base_url}/admin/products/bulk", json=[row],
+                                          headers=headers, timeout=10)
+            
+            products = requests.get(f"{self.base_url}/admin/products", headers=headers, timeout=10).json()
+            stored = next((item for item in products if item["id"] == product_id), {})
+            kept = (stored.get("price") == 12000 and stored.get("stock") == 7
+                    and stored.get("description") == product["description"]
+                    and stored.get("image_variants") == product["image_variants"])
+            
+            if import_response.status_code == 200 and kept:
+                self.log_test("Bulk Import Partial Update", True,
+                            "Price updated; stock, description and image variants kept")
+            else:
+                self.log_test("Bulk Import Partial Update", False,
+                            f"HTTP {import_response.status_code}",
+                            f"Stored product: {stored}")
+        except Exception as e:
+            self.log_test("Bulk Import Partial Update", False, f"Request failed: {str(e)}")
+        finally:
+            if product_id:
+                requests.delete(f"{self.base_url}/admin/products/{product_id}", headers=headers, timeout=10)
+
+    def test_product_update_keeps_image_variants(self):
+        """Test that editing a product without image_variants keeps the stored variants"""
+        if not self.admin_token:
+            self.log_test("Product Update Keeps Variants", False, "No admin token available")
+            return
+        
+        headers = {"Authorization": f"Bearer {self.admin_token}"}
+        product = {
+            "name": "Test Pempek Variants",
+            "price": 15000,
+            "category_id": str(uuid.uuid4()),
+            "category_name": "Pempek Goreng",
+            "image_url": "/api/media/0123456789abcdef-900.jpg",
+            "stock": 5,
+            "description": "Produk uji",
+            "image_variants": {"jpeg_320": "/api/media/0123456789abcdef-320.jpg",
+                               "webp_320": "/api/media/0123456789abcdef-320.webp"}
+        }
+        product_id = None
+        try:
+            create_response = requests.post(f"{self.base_url}/admin/products", json=product,
+                                          headers=headers, timeout=10)
+            product_id = create_response.json().get("product_id")
+            
+            # What the admin edit form sends: every field except the variants
+            edit = {key: value for key, value in product.items() if key != "image_variants"}
+            edit.update({"id": product_id, "price": 16000})
+            update_response = requests.put(f"{self.base_url}/admin/products/{product_id}", json=edit,
+                                         headers=headers, timeout=10)
+            
+            products = requests.get(f"{self.base_url}/admin/products", headers=headers, timeout=10).json()
+            stored = next((item for item in products if item["id"] == product_id), {})
+            if (update_response.status_code == 200 and stored.get("price") == 16000
+                    and stored.get("image_variants") == product["image_variants"]):
+                self.log_test("Product Update Keeps Variants", True, "Price updated, image variants kept")
+            else:
+                self.log_test("Product Update Keeps Variants", False,
+                            f"HTTP {update_response.status_code}",
+                            f"Stored product: {stored}")
+        except Exception as e:
+            self.log_test("Product Update Keeps Variants", False, f"Request failed: {str(e)}")
+        finally:
+            if product_id:
+                requests.delete(f"{self.base_url}/admin/products/{product_id}", headers=headers, timeout=10)
+
+    def test_product_search(self):
+        """Test GET /api/products/search prefix matching, accent folding and ranking"""
+        if not self.admin_token:
+            self.log_test("Product Search", False, "No admin token available")
+            return
+        
+        headers = {"Authorization": f"Bearer {self.admin_token}"}
+        # "Kelakar" only appears in these two products: in one name and in the other's description
+        test_products = [
+            {"name": "Tekwan Uji Cari", "price": 10000, "category_id": str(uuid.uuid4()),
+             "category_name": "Pempek Kuah", "image_url": "https://images.unsplash.com/photo-1587907988134-94b4d1c3e40e",
+             "stock": 5, "description": "Kuah kelakar khas Palembang"},
+            {"name": "Pempek Kelakar Uji", "price": 12000, "category_id": str(uuid.uuid4()),
+             "category_name": "Pempek Goreng", "image_url": "https://images.unsplash.com/photo-1587907988134-94b4d1c3e40e",
+             "stock": 5, "description": "Produk uji pencarian"},
+        ]
+        product_ids = []
+        try:
+            for product in test_products:
+                response = requests.post(f"{self.base_url}/admin/products", json=product, headers=headers, timeout=10)
+                product_ids.append(response.json().get("product_id"))
+            
+            ranked = requests.get(f"{self.base_url}/products/search", params={"q": "KELAK"}, timeout=10).json()
+            ranked_ids = [product["id"] for product in ranked]
+            if ranked_ids == [product_ids[1], product_ids[0]]:
+                self.log_test("Product Search Ranking", True,
+                            "Prefix 'KELAK' matched both products, name match ranked above description match")
+            else:
+                self.log_test("Product Search Ranking", False,
+                            "Expected the name match first, then the description match",
+                            f"Got: {[product.get('name') for product in ranked]}")
+            
+            folded = requests.get(f"{self.base_url}/products/search", params={"q": "PÉMP"}, timeout=10).json()
+            names = [product.get("name", "") for product in folded]
+            # Names and category names are indexed, e.g. Tekwan sits in the "Pempek Kuah" category
+            if names and all("pempek" in f"{product.get('name')} {product.get('category_name')}".lower()
+                             for product in folded):
+                self.log_test("Product Search Accent Folding", True, f"'PÉMP' matched {len(names)} Pempek products")
+            else:
+                self.log_test("Product Search Accent Folding", False, "Expected only Pempek products",
+                            f"Got: {names}")
+            
+            missing = requests.get(f"{self.base_url}/products/search", params={"q": "kelakar zzzz"}, timeout=10).json()
+            if missing == []:
+                self.log_test("Product Search All Terms", True, "A term matching nothing returns no results")
+            else:
+                self.log_test("Product Search All Terms", False, "Every query term has to match",
+                            f"Got: {[product.get('name') for product in missing]}")
+        except Exception as e:
+            self.log_test("Product Search", False, f"Request failed: {str(e)}")
+        finally:
+            for product_id in product_ids:
+                if product_id:
+                    requests.delete(f"{self.base_url}/admin/products/{product_id}", headers=headers, timeout=10)
+
+    def test_request_limits(self):
+        """Test order size limits and login rate limiting, including CORS headers on rejections"""
+        origin_headers = {"Origin": "https://example.com"}
+        try:
+            products = requests.get(f"{self.base_url}/products", timeout=10).json()
+            too_many_items = {
+                "customer_name": "Budi Santoso",
+                "customer_phone": "081234567890",
+                "customer_address": "Jl. Sudirman No. 123, Palembang",
+                "items": [{"id": products[0]["id"], "quantity": 1}] * 51
+            }
+            response = self.post_order(json=too_many_items,
+                                       headers=origin_headers, timeout=10)
+            if response.status_code == 422 and "access-control-allow-origin" in response.headers:
+                self.log_test("Order Item Limit", True, "Order with too many items rejected",
+                            f"Detail: {response.json().get('detail')}")
+            else:
+                self.log_test("Order Item Limit", False,
+                            f"Expected HTTP 422 with CORS headers, got {response.status_code}",
+                            f"Headers: {dict(response.headers)}")
+            
+            response = self.post_order(data="x" * (32 * 1024),
+                                       headers={**origin_headers, "Content-Type": "application/json"}, timeout=10)
+            if response.status_code == 413:
+                self.log_test("Order Body Limit", True, "Oversized order body rejected")
+            else:
+                self.log_test("Order Body Limit", False, f"Expected HTTP 413, got {response.status_code}",
+                            response.text)
+            
+            # Wrong credentials until the per-IP login bucket runs dry; run last so other tests keep their token
+            login_data = {"username": ADMIN_USERNAME, "password": "wrong-password"}
+            for _ in range(20):
+                response = requests.post(f"{self.base_url}/admin/login", json=login_data,
+                                       headers=origin_headers, timeout=10)
+                if response.status_code == 429:
+                    break
+            if (response.status_code == 429 and response.headers.get("Retry-After")
+                    and "access-control-allow-origin" in response.headers):
+                self.log_test("Login Rate Limit", True, "Repeated failed logins throttled",
+                            f"Retry-After: {response.headers['Retry-After']}s")
+            else:
+                self.log_test("Login Rate Limit", False,
+                            f"Expected HTTP 429 with Retry-After and CORS headers, got {response.status_code}",
+                            f"Headers: {dict(response.headers)}")
+        except Exception as e:
+            self.log_test("Request Limits", False, f"Request failed: {str(e)}")
+
     def test_environment_variables(self):
         """Test that environment variables are properly configured"""
         try:
@@ -415,13 +970,23 @@ class PempekDominoTester:
         
         # Run tests in logical order
         self.test_environment_variables()
+        self.test_health_endpoint()
         self.test_database_initialization()
         self.test_categories_endpoint()
+        self.test_storefront_endpoint()
         self.test_products_endpoint()
         self.test_order_creation()
         self.test_admin_login()
         self.test_admin_orders()
+        self.test_order_status_transitions()
+        self.test_sales_analytics()
+        self.test_orders_export_resume()
+        self.test_order_stream()
         self.test_admin_products_crud()
+        self.test_bulk_import_keeps_unlisted_fields()
+        self.test_product_update_keeps_image_variants()
+        self.test_product_search()
+        self.test_request_limits()
         
         # Summary
         print("=" * 80)
@@ -1,18 +1,49 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import './App.css';
 
 const API_BASE = process.env.REACT_APP_BACKEND_URL;
 
+// Uploaded images are served by the backend under a relative /api/media/ path
+const mediaUrl = (url) => (url && url.startsWith('/') ? `${API_BASE}${url}` : url);
+
+const imageSrcSet = (product, format) =>
+  Object.entries(product.image_variants || {})
+    .filter(([key]) => key.startsWith(`${format}_`))
+    .map(([key, url]) => `${mediaUrl(url)} ${key.split('_')[1]}w`)
+    .join(', ');
+
+const thumbnailUrl = (product) => {
+  const widths = Object.keys(product.image_variants || {})
+    .filter(key => key.startsWith('jpeg_'))
+    .map(key => Number(key.split('_')[1]));
+  return widths.length
+    ? mediaUrl(product.image_variants[`jpeg_${Math.min(...widths)}`])
+    : mediaUrl(product.image_url);
+};
+
+// crypto.randomUUID only exists in secure contexts (HTTPS or localhost); getRandomValues works everywhere
+const newIdempotencyKey = () => {
+  if (typeof crypto.randomUUID === 'function') return crypto.randomUUID();
+  const bytes = crypto.getRandomValues(new Uint8Array(16));
+  bytes[6] = (bytes[6] & 0x0f) | 0x40; // version 4
+  bytes[8] = (bytes[8] & 0x3f) | 0x80; // RFC 4122 variant
+  const hex = Array.from(bytes, byte => byte.toString(16).padStart(2, '0')).join('');
+  return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`;
+};
+
 function App() {
   const [currentPage, setCurrentPage] = useState('home');
   const [products, setProducts] = useState([]);
   const [categories, setCategories] = useState([]);
+  const [productsByCategory, setProductsByCategory] = useState({});
   const [selectedCategory, setSelectedCategory] = useState('');
+  const [searchQuery, setSearchQuery] = useState('');
   const [cart, setCart] = useState([]);
   const [showCart, setShowCart] = useState(false);
   const [isAdmin, setIsAdmin] = useState(false);
   const [adminToken, setAdminToken] = useState('');
   const [adminOrders, setAdminOrders] = useState([]);
+  const [adminOrdersCursor, setAdminOrdersCursor] = useState(null);
   const [adminProducts, setAdminProducts] = useState([]);
 
   // Customer form data
@@ -22,6 +53,9 @@ function App() {
     address: ''
   });
 
+  // One key per checkout attempt, so retries of the same cart are not placed twice
+  const orderIdempotencyKey = useRef(null);
+
   // Admin login data
   const [adminLogin, setAdminLogin] = useState({
     username: '',
@@ -41,42 +75,49 @@ function App() {
 
   // Load initial data
   useEffect(() => {
-    loadCategories();
-    loadProducts();
+    loadStorefront();
   }, []);
 
-  const loadCategories = async () => {
+  // Categories and products grouped by category in one request; category filtering happens locally
+  const loadStorefront = async () => {
     try {
-      const response = await fetch(`${API_BASE}/api/categories`);
+      const response = await fetch(`${API_BASE}/api/storefront`);
       const data = await response.json();
-      setCategories(data);
+      setCategories(data.categories);
+      setProductsByCategory(data.products);
     } catch (error) {
-      console.error('Error loading categories:', error);
+      console.error('Error loading storefront:', error);
     }
   };
 
-  const loadProducts = async () => {
+  const searchProducts = async (query) => {
     try {
-      const url = selectedCategory 
-        ? `${API_BASE}/api/products?category=${selectedCategory}`
-        : `${API_BASE}/api/products`;
-      const response = await fetch(url);
+      const response = await fetch(`${API_BASE}/api/products/search?q=${encodeURIComponent(query)}`);
       const data = await response.json();
-      setProducts(data);
+      setProducts(selectedCategory ? data.filter(product => product.category_id === selectedCategory) : data);
     } catch (error) {
-      console.error('Error loading products:', error);
+      console.error('Error searching products:', error);
     }
   };
 
-  const loadAdminOrders = async () => {
+  const loadAdminOrders = async (cursor = null) => {
     try {
-      const response = await fetch(`${API_BASE}/api/admin/orders`, {
+      const url = cursor
+        ? `${API_BASE}/api/admin/orders?cursor=${encodeURIComponent(cursor)}`
+        : `${API_BASE}/api/admin/orders`;
+      const response = await fetch(url, {
         headers: {
           'Authorization': `Bearer ${adminToken}`
         }
       });
+      if (response.status === 401) {
+        // Token expired or revoked
+        adminLogout();
+        return;
+      }
       const data = await response.json();
-      setAdminOrders(data);
+      setAdminOrders(cursor ? [...adminOrders, ...data.orders] : data.orders);
+      setAdminOrdersCursor(data.next_cursor);
     } catch (error) {
       console.error('Error loading admin orders:', error);
     }
@@ -97,8 +138,21 @@ function App() {
   };
 
   useEffect(() => {
-    loadProducts();
-  }, [selectedCategory]);
+    if (!searchQuery.trim()) {
+      setProducts(selectedCategory
+        ? productsByCategory[selectedCategory] || []
+        : Object.values(productsByCategory).flat());
+      return;
+    }
+    // Wait for a pause in typing before querying
+    const timer = setTimeout(() => searchProducts(searchQuery), 200);
+    return () => clearTimeout(timer);
+  }, [selectedCategory, searchQuery, productsByCategory]);
+
+  // A different order body needs a new key; reusing one for a changed order is rejected with 422
+  useEffect(() => {
+    orderIdempotencyKey.current = null;
+  }, [cart, customerData]);
 
   useEffect(() => {
     if (isAdmin && adminToken) {
@@ -107,6 +161,68 @@ function App() {
     }
   }, [isAdmin, adminToken]);
 
+  // Live order feed: new orders and status changes are pushed instead of re-fetching the list
+  useEffect(() => {
+    if (!isAdmin || !adminToken) return;
+
+    let source = null;
+    let retryTimer = null;
+    let lastEventId = null;
+    let stopped = false;
+
+    const reconnectLater = () => {
+      if (!stopped) retryTimer = setTimeout(connect, 3000);
+    };
+
+    // The stream takes a single-use ticket instead of the admin token, so every (re)connect fetches a new one
+    const connect = async () => {
+      try {
+        const response = await fetch(`${API_BASE}/api/admin/orders/stream-ticket`, {
+          method: 'POST',
+          headers: { 'Authorization': `Bearer ${adminToken}` }
+        });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const { ticket } = await response.json();
+        if (stopped) return;
+
+        const params = new URLSearchParams({ ticket });
+        if (lastEventId) params.set('last_event_id', lastEventId);
+        source = new EventSource(`${API_BASE}/api/admin/orders/stream?${params}`);
+        source.addEventListener('order_created', (event) => {
+          lastEventId = event.lastEventId;
+          const order = JSON.parse(event.data);
+          setAdminOrders(orders => orders.some(o => o.id === order.id) ? orders : [order, ...orders]);
+        });
+        source.addEventListener('order_updated', (event) => {
+          lastEventId = event.lastEventId;
+          const order = JSON.parse(event.data);
+          setAdminOrders(orders => orders.map(o => o.id === order.id ? order : o));
+        });
+        // Sent when the server can no longer replay what we missed while disconnected
+        source.addEventListener('reset', (event) => {
+          lastEventId = event.lastEventId;
+          loadAdminOrders();
+        });
+        // The browser's own retry would reuse the spent ticket, so reconnect with a fresh one instead
+        source.onerror = () => {
+          source.close();
+          reconnectLater();
+        };
+      } catch (error) {
+        console.error('Error connecting to order stream:', error);
+        reconnectLater();
+      }
+    };
+
+    connect();
+
+    return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
+  }, [isAdmin, adminToken]);
+
   const addToCart = (product) => {
     const existingItem = cart.find(item => item.id === product.id);
     if (existingItem) {
@@ -152,18 +268,23 @@ function App() {
     }
 
     try {
+      // Prices and totals are recalculated by the server from the product catalog
       const orderData = {
         customer_name: customerData.name,
         customer_phone: customerData.phone,
         customer_address: customerData.address,
-        items: cart,
-        total_amount: getTotalAmount()
+        items: cart.map(item => ({ id: item.id, quantity: item.quantity }))
       };
 
+      if (!orderIdempotencyKey.current) {
+        orderIdempotencyKey.current = newIdempotencyKey();
+      }
+
       const response = await fetch(`${API_BASE}/api/orders`, {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          'Idempotency-Key': orderIdempotencyKey.current
         },
         body: JSON.stringify(orderData)
       });
@@ -175,6 +296,13 @@ function App() {
         setCart([]);
         setCustomerData({ name: '', phone: '', address: '' });
         setCurrentPage('home');
+        loadStorefront();
+      } else if (response.status === 409 && Array.isArray(result.detail?.items)) {
+        alert(`Stok tidak mencukupi untuk: ${result.detail.items.join(', ')}`);
+        loadStorefront();
+      } else if (response.status === 409) {
+        // The same order (same Idempotency-Key) is still being processed
+        alert('Pesanan Anda sedang diproses. Mohon tunggu sebentar sebelum mencoba lagi.');
       } else {
         throw new Error(result.detail || 'Gagal mengirim pesanan');
       }
@@ -248,7 +376,7 @@ function App() {
           description: ''
         });
         loadAdminProducts();
-        loadProducts();
+        loadStorefront();
       } else {
         throw new Error(result.detail || 'Gagal menambahkan produk');
       }
@@ -272,7 +400,7 @@ function App() {
       if (response.ok) {
         alert('Produk berhasil dihapus!');
         loadAdminProducts();
-        loadProducts();
+        loadStorefront();
       } else {
         throw new Error('Gagal menghapus produk');
       }
@@ -282,7 +410,47 @@ function App() {
     }
   };
 
+  const ORDER_NEXT_STATUSES = {
+    pending: ['confirmed', 'cancelled'],
+    confirmed: ['cooking', 'cancelled'],
+    cooking: ['delivered', 'cancelled'],
+    delivered: [],
+    cancelled: []
+  };
+
+  const updateOrderStatus = async (orderId, newStatus) => {
+    try {
+      const response = await fetch(`${API_BASE}/api/admin/orders/${orderId}`, {
+        method: 'PATCH',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${adminToken}`
+        },
+        body: JSON.stringify({ status: newStatus })
+      });
+
+      const result = await response.json();
+
+      if (response.ok) {
+        setAdminOrders(orders => orders.map(o => o.id === result.id ? result : o));
+      } else {
+        throw new Error(result.detail || 'Gagal mengubah status');
+      }
+    } catch (error) {
+      console.error('Error updating order status:', error);
+      alert('Gagal mengubah status pesanan');
+    }
+  };
+
   const adminLogout = () => {
+    if (adminToken) {
+      fetch(`${API_BASE}/api/admin/logout`, {
+        method: 'POST',
+        headers: {
+          'Authorization': `Bearer ${adminToken}`
+        }
+      }).catch(error => console.error('Error during admin logout:', error));
+    }
     setIsAdmin(false);
     setAdminToken('');
     setCurrentPage('home');
@@ -388,6 +556,17 @@ function App() {
       </header>
 
       <div className="container mx-auto px-4 py-8">
+        {/* Search */}
+        <div className="mb-4">
+          <input
+            type="search"
+            placeholder="Cari produk..."
+            value={searchQuery}
+            onChange={(e) => setSearchQuery(e.target.value)}
+            className="w-full md:w-96 p-3 border border-gray-300 rounded-lg"
+          />
+        </div>
+
         {/* Category Filter */}
         <div className="mb-8">
           <div className="flex flex-wrap gap-2">
@@ -400,8 +579,8 @@ function App() {
             {categories.map(category => (
               <button
                 key={category.id}
-                onClick={() => setSelectedCategory(category.name)}
-                className={`px-4 py-2 rounded-full ${selectedCategory === category.name ? 'bg-orange-500 text-white' : 'bg-white text-gray-700 border border-gray-300'}`}
+                onClick={() => setSelectedCategory(category.id)}
+                className={`px-4 py-2 rounded-full ${selectedCategory === category.id ? 'bg-orange-500 text-white' : 'bg-white text-gray-700 border border-gray-300'}`}
               >
                 {category.name}
               </button>
@@ -413,11 +592,21 @@ function App() {
         <div className="grid md:grid-cols-2 lg:grid-cols-3 gap-6">
           {products.map(product => (
             <div key={product.id} className="bg-white rounded-xl shadow-md overflow-hidden hover:shadow-lg transition-shadow">
-              <img 
-                src={product.image_url} 
-                alt={product.name}
-                className="w-full h-48 object-cover"
-              />
+              <picture>
+                <source
+                  type="image/webp"
+                  srcSet={imageSrcSet(product, 'webp') || undefined}
+                  sizes="(min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw"
+                />
+                <img 
+                  src={mediaUrl(product.image_url)} 
+                  srcSet={imageSrcSet(product, 'jpeg') || undefined}
+                  sizes="(min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw"
+                  alt={product.name}
+                  loading="lazy"
+                  className="w-full h-48 object-cover"
+                />
+              </picture>
               <div className="p-4">
                 <h3 className="text-xl font-semibold mb-2">{product.name}</h3>
                 <p className="text-gray-600 text-sm mb-2">{product.description}</p>
@@ -463,7 +652,7 @@ function App() {
                     {cart.map(item => (
                       <div key={item.id} className="flex items-center space-x-4 p-4 border border-gray-200 rounded-lg">
                         <img 
-                          src={item.image_url} 
+                          src={thumbnailUrl(item)} 
                           alt={item.name}
                           className="w-16 h-16 object-cover rounded-lg"
                         />
@@ -634,9 +823,26 @@ function App() {
                     }`}>
                       {order.status}
                     </span>
+                    {(ORDER_NEXT_STATUSES[order.status] || []).map(nextStatus => (
+                      <button
+                        key={nextStatus}
+                        onClick={() => updateOrderStatus(order.id, nextStatus)}
+                        className="ml-2 px-2 py-1 rounded-full text-xs border border-gray-300 hover:bg-gray-50"
+                      >
+                        {nextStatus}
+                      </button>
+                    ))}
                   </div>
                 </div>
               ))}
+              {adminOrdersCursor && (
+                <button
+                  onClick={() => loadAdminOrders(adminOrdersCursor)}
+                  className="w-full border border-gray-300 hover:bg-gray-50 text-gray-700 py-2 rounded-lg text-sm"
+                >
+                  Muat Lebih Banyak
+                </button>
+              )}
             </div>
           </div>
 
@@ -707,7 +913,7 @@ function App() {
               {adminProducts.map(product => (
                 <div key={product.id} className="flex items-center space-x-3 p-3 border border-gray-200 rounded-lg">
                   <img 
-                    src={product.image_url} 
+                    src={thumbnailUrl(product)} 
                     alt={product.name}
                     className="w-12 h-12 object-cover rounded-lg"
                   />